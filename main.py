@@ -1,50 +1,129 @@
-from modules.io_handler import load_instructions, save_output
-from modules.pipeline import Pipeline
+import argparse
+from contextlib import nullcontext
 
-def simulate_pipeline(instructions):
-    pipeline = Pipeline(input_number)
-    index = 0
+from modules.batch import expand_inputs, format_summary, run_batch
+from modules.bintrace import BinaryTraceWriter
+from modules.checkpoint import load_checkpoint
+from modules.counters import counters_path
+from modules.io_handler import OutputWriter
+from modules.memory import DEFAULT_MEMORY_WORDS, create_memory, load_memory_image
+from modules.profiler import StageProfiler, format_profile
+from modules.pipeline import BACKENDS
+from modules.program import load_program
+from modules.sampling import format_sample, sample_cpi
+from modules.simulator import simulate_functional, simulate_pipeline
+from modules.sweep import MAX_CYCLES
+from modules.trace import TRACE_LEVELS, Tracer, parse_trace_level
 
-    while any([pipeline.IF_ID, pipeline.ID_EX, pipeline.EX_MEM, pipeline.MEM_WB]) or index < len(instructions):
-        if pipeline.simulate_pipeline_index!=index:
-            index=pipeline.simulate_pipeline_index
+def main(input_number, args=None):
+    args = args if args is not None else parse_args([])
+    # 讀取輸入指令檔案，只解碼一次，之後各模式共用同一個 Program
 
-        if not pipeline.detect_hazard_lw_stall() and index < len(instructions):
-            current_instruction = instructions[index]
-            index += 1
-            pipeline.simulate_pipeline_index=index
+    program = load_program("inputs/test"+input_number+".txt", cache=not args.no_program_cache)
+    tracer = Tracer(args.trace)
+    if tracer.summary:
+        print("Loaded Instructions:", program.lines())
+    memory = build_memory(args)
+    if args.sample:
+        print(format_sample(sample_cpi(program, *args.sample, warmup=args.sample_warmup, memory=memory)))
+        return
+
+    # 接續時輸出檔截斷到 checkpoint 當下的長度再續寫
+    resume_state = load_checkpoint(args.resume) if args.resume else None
+    output_offset = resume_state["output_offset"] if resume_state else None
+    profiler = StageProfiler() if args.profile else None
+    # 執行管線模擬，結果邊模擬邊寫入檔案
+    binary_trace = (BinaryTraceWriter(args.binary_trace, program)
+                    if args.binary_trace and not args.functional else nullcontext())
+    with OutputWriter("outputs/result_test"+input_number+".txt", offset=output_offset) as output, binary_trace:
+        if args.functional:
+            simulate_functional(program, tracer, output,
+                                memory=memory, memory_range=args.dump_memory)
         else:
-            if index < len(instructions):
-               current_instruction = instructions[index]
-            else:
-               current_instruction = None
-            #current_instruction = None
-
-        pipeline.step(current_instruction)
-
-        # 最終寄存器和記憶體的狀態
-    pipeline.output.append("\nFinal Register Values:")
-    pipeline.output.append(" ".join([f"${i}={pipeline.registers[i]}" for i in range(32)]))
-    pipeline.output.append("\nFinal Memory Values:")
-    pipeline.output.append(" ".join([f"M[{i}]={pipeline.memory[i]}" for i in range(32)]))
-
-    # 總執行周期數
-    pipeline.output.append(f"\nTotal Cycles: {pipeline.cycle}")
-    return pipeline.output
-
-def main():
-    # 讀取輸入指令檔案
-
-    instructions = load_instructions("inputs/test"+input_number+".txt")
-    print("Loaded Instructions:", instructions)
-    # 執行管線模擬
-    pipeline_results = simulate_pipeline(instructions)
-
-    # 保存結果到檔案
-    save_output(pipeline_results, "outputs/result_test"+input_number+".txt")
+            simulate_pipeline(program, tracer, output, args.fast_forward,
+                              args.checkpoint, args.checkpoint_every, resume_state,
+                              memory=memory, memory_range=args.dump_memory,
+                              loop_memo=not args.no_loop_memo,
+                              counters=counters_path("outputs/result_test"+input_number+".txt"),
+                              profiler=profiler, binary_trace=binary_trace if args.binary_trace else None,
+                              backend=args.backend)
     print("Results saved to outputs/result_test"+input_number+".txt")
+    if args.binary_trace and not args.functional:
+        print("Binary trace saved to "+args.binary_trace)
+    if profiler:
+        profiler.write_collapsed(args.profile)
+        print(format_profile(profiler))
+        print("Collapsed stacks saved to "+args.profile)
+
+def build_memory(args):
+    """依命令列參數建立記憶體"""
+    if args.memory_image:
+        return load_memory_image(args.memory_image)
+    return create_memory(args.memory_size, sparse=args.sparse_memory)
+
+def trace_level(text):
+    """--trace 的值：名稱或數字，不認得時由 argparse 印出用法錯誤"""
+    try:
+        return parse_trace_level(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+def parse_range(text):
+    """'START:STOP' -> (START, STOP)"""
+    start, _, stop = text.partition(":")
+    return int(start or 0), int(stop)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="五級管線模擬器")
+    parser.add_argument("test", nargs="?", help="測資號碼，例如 3 代表 inputs/test3.txt")
+    parser.add_argument("--batch", nargs="+", metavar="PATTERN",
+                        help="批次模擬多個程式檔，可給 glob 或目錄，例如 'inputs/test*.txt'")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="批次模式的 worker 數，預設為 CPU 核心數")
+    parser.add_argument("-o", "--output-dir", default="outputs", help="批次模式的輸出目錄")
+    parser.add_argument("--max-cycles", type=int, default=MAX_CYCLES, metavar="N",
+                        help="批次模式每個程式最多模擬的 cycle 數，超過時該程式列為錯誤")
+    parser.add_argument("--functional", action="store_true", help="只用功能模式執行，輸出最終狀態")
+    parser.add_argument("--fast-forward", type=int, default=0, metavar="N",
+                        help="前 N 條指令以功能模式執行後再切換到管線模擬")
+    parser.add_argument("--checkpoint", metavar="FILE", help="定期將管線狀態存到這個 checkpoint 檔")
+    parser.add_argument("--checkpoint-every", type=int, default=0, metavar="CYCLES",
+                        help="每隔多少 cycle 存一次 checkpoint，使用 --checkpoint 時必須指定")
+    parser.add_argument("--resume", metavar="FILE", help="從 checkpoint 檔接續模擬")
+    parser.add_argument("--sample", nargs=2, type=int, metavar=("INTERVAL", "WINDOW"),
+                        help="抽樣模擬：每 INTERVAL 條指令詳細模擬 WINDOW 條，其餘快轉，估計 CPI")
+    parser.add_argument("--sample-warmup", type=int, default=100, metavar="N",
+                        help="抽樣模擬時每段量測前先跑幾條指令暖機")
+    parser.add_argument("--memory-size", type=int, default=DEFAULT_MEMORY_WORDS, metavar="WORDS",
+                        help="記憶體大小（字組數）")
+    parser.add_argument("--sparse-memory", action="store_true", help="使用分頁表的稀疏記憶體")
+    parser.add_argument("--memory-image", metavar="FILE", help="以 mmap 載入二進位記憶體初始映像")
+    parser.add_argument("--dump-memory", type=parse_range, default=None, metavar="START:STOP",
+                        help="最後輸出的記憶體範圍，預設為 0:32")
+    parser.add_argument("--no-loop-memo", action="store_true",
+                        help="關閉往回跳迴圈的記憶化，每一圈都逐 cycle 模擬")
+    parser.add_argument("--no-program-cache", action="store_true",
+                        help="不讀寫程式檔旁邊的編譯映像（.prog），每次都重新解析")
+    parser.add_argument("--binary-trace", metavar="FILE",
+                        help="將每個 cycle 的管線佔用情形寫成可隨機讀取的二進位追蹤檔")
+    parser.add_argument("--backend", choices=BACKENDS, default="interp",
+                        help="EX/MEM/WB 的執行方式：interp 直譯，threaded 用每條指令預先編譯好的函式")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="量測模擬器各階段的時間，並將 collapsed stack（flame graph 格式）寫到 FILE")
+    parser.add_argument("--trace", type=trace_level, default="stage", metavar="LEVEL",
+                        help="追蹤等級：" + "、".join(TRACE_LEVELS) + "，或 0 到 3 的數字")
+    args = parser.parse_args(argv)
+    # 沒有間隔時 run_pipeline 不會存任何 checkpoint
+    if args.checkpoint and args.checkpoint_every <= 0:
+        parser.error("--checkpoint requires a positive --checkpoint-every")
+    return args
 
 if __name__ == "__main__":
-    input_number=input('請輸入測資號碼')
-    pipeline = Pipeline(input_number)
-    main()
+    args = parse_args()
+    if args.batch:
+        paths = expand_inputs(args.batch)
+        if not paths:
+            raise SystemExit("No program files matched: " + " ".join(args.batch))
+        print(format_summary(run_batch(paths, args.output_dir, args.jobs, args.max_cycles)))
+    else:
+        input_number = args.test if args.test else input('請輸入測資號碼')
+        main(input_number, args)
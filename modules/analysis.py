@@ -0,0 +1,143 @@
+from collections import Counter
+from functools import cached_property
+
+# 往前看幾條指令就足以涵蓋所有 stall 與 forwarding 的情況
+MAX_DISTANCE = 3
+
+# stall 的原因，0 代表不需要 stall
+STALL_LOAD_USE = 1   # lw 的結果緊接著被使用
+STALL_BRANCH = 2     # beq 比較時來源還在前面的 lw 或 add/sub 中
+STALL_DATA = 3       # 關閉 forwarding 時等待寫回
+
+
+def destination(instruction):
+    """指令寫入的暫存器，沒有則為 None"""
+    if instruction is None:
+        return None
+    if instruction.op in ("add", "sub"):
+        return instruction.rd
+    if instruction.op == "lw":
+        return instruction.reg
+    return None
+
+
+def sources(instruction):
+    """指令讀取的暫存器"""
+    if instruction.op in ("add", "sub", "beq"):
+        return (instruction.rs, instruction.rt)
+    if instruction.op == "lw":
+        return (instruction.base,)
+    return (instruction.base, instruction.reg)
+
+
+def lw_stall(if_id, id_ex, ex_mem):
+    """與 Pipeline.detect_hazard_lw_stall 相同的判斷，參數為 Instruction 或 None，回傳 stall 原因"""
+    if if_id is None:
+        return 0
+    if id_ex is not None and id_ex.op == "lw":
+        hazard = if_id.op in ("add", "sub", "beq") and id_ex.reg in (if_id.rs, if_id.rt)
+        return STALL_LOAD_USE if hazard else 0
+    if ex_mem is not None and ex_mem.op == "lw":
+        hazard = if_id.op == "beq" and ex_mem.reg in (if_id.rs, if_id.rt)
+        return STALL_BRANCH if hazard else 0
+    if id_ex is not None and id_ex.op in ("add", "sub"):
+        hazard = if_id.op == "beq" and id_ex.rd in (if_id.rs, if_id.rt)
+        return STALL_BRANCH if hazard else 0
+    return 0
+
+
+def forward_codes(instruction, mem_wb):
+    """與 Pipeline.detect_forwarding_signals 相同的判斷
+
+    執行 EX 時 EX/MEM 已經清空，只有 MEM/WB（前一條指令）可能轉送。
+    欄位不存在時視為 None，與 latch dict 的 .get 一致。
+    """
+    if mem_wb is None:
+        return "00", "00"
+    rd = destination(mem_wb)
+    forward_a = "01" if rd == instruction.rs else "00"
+    forward_b = "01" if rd == instruction.rt else "00"
+    if instruction.op == "sw" and rd == instruction.reg:
+        forward_b = "01"
+    return forward_a, forward_b
+
+
+class ProgramAnalysis:
+    """程式的靜態相依分析
+
+    假設沿著 fall-through 順序執行、中間沒有 bubble，事先算好：
+      stall[j]    IF/ID 為第 j 條、ID/EX 為 j-1、EX/MEM 為 j-2 時的 stall 原因（0 為不需要）
+      forward[j]  第 j 條在 EX、MEM/WB 為 j-1 時的 (ForwardA, ForwardB)
+    producers 與 histogram 只在需要報告時才計算。
+    """
+
+    def __init__(self, instructions):
+        self.instructions = instructions
+        self.stall = []
+        self.forward = []
+
+        # 相同內容的指令共用 Instruction 物件，同樣的組合只需要判斷一次
+        stall_cache = {}
+        forward_cache = {}
+        previous1 = previous2 = None
+        for instruction in instructions:
+            if instruction is None:
+                self.stall.append(0)
+                self.forward.append(("00", "00"))
+            else:
+                key = (instruction, previous1, previous2)
+                stall = stall_cache.get(key)
+                if stall is None:
+                    stall = stall_cache[key] = lw_stall(instruction, previous1, previous2)
+                self.stall.append(stall)
+
+                key = (instruction, previous1)
+                forward = forward_cache.get(key)
+                if forward is None:
+                    forward = forward_cache[key] = forward_codes(instruction, previous1)
+                self.forward.append(forward)
+            previous2, previous1 = previous1, instruction
+
+    @cached_property
+    def producers(self):
+        """每條指令的每個來源暫存器最近一次被寫入的 (暫存器, 距離, 種類)，種類為 load 或 alu"""
+        instructions = self.instructions
+        table = []
+        for j, instruction in enumerate(instructions):
+            producers = []
+            if instruction is not None:
+                for register in sorted(set(sources(instruction))):
+                    for distance in range(1, min(MAX_DISTANCE, j) + 1):
+                        producer = instructions[j - distance]
+                        if destination(producer) == register:
+                            producers.append((register, distance, "load" if producer.op == "lw" else "alu"))
+                            break
+            table.append(tuple(producers))
+        return table
+
+    @cached_property
+    def histogram(self):
+        """靜態 hazard 統計：producer->consumer 距離、stall 與 forwarding 次數"""
+        histogram = Counter()
+        for instruction, producers, stall, forward in zip(self.instructions, self.producers,
+                                                          self.stall, self.forward):
+            if instruction is None:
+                continue
+            for register, distance, kind in producers:
+                histogram[f"{kind}->{instruction.op} d{distance}"] += 1
+            if stall:
+                histogram["stall"] += 1
+            if instruction.op in ("add", "sub", "beq"):
+                histogram["forward A"] += forward[0] == "01"
+                histogram["forward B"] += forward[1] == "01"
+        return histogram
+
+
+def format_histogram(analysis):
+    """將靜態 hazard 統計排成文字"""
+    lines = ["Static hazard histogram:"]
+    if not analysis.histogram:
+        lines.append("  (none)")
+    for key in sorted(analysis.histogram):
+        lines.append(f"  {key:<16} {analysis.histogram[key]}")
+    return "\n".join(lines)
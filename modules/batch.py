@@ -0,0 +1,82 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.counters import counters_path
+from modules.io_handler import OutputWriter
+from modules.pipeline import Pipeline
+from modules.program import load_program
+from modules.simulator import advance, run_pipeline
+from modules.sweep import MAX_CYCLES
+from modules.trace import SILENT
+
+def expand_inputs(patterns):
+    """展開 glob 或目錄，回傳排序後不重複的程式檔清單"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.txt")
+        paths.update(path for path in glob.glob(pattern) if os.path.isfile(path))
+    return sorted(paths)
+
+def result_path(program_path, output_dir="outputs"):
+    """inputs/test3.txt -> outputs/result_test3.txt"""
+    name = os.path.splitext(os.path.basename(program_path))[0]
+    return os.path.join(output_dir, f"result_{name}.txt")
+
+def simulate_file(program_path, output_dir="outputs", max_cycles=MAX_CYCLES):
+    """模擬單一程式檔並寫出結果，回傳摘要
+
+    超過 max_cycles 還沒跑完（例如無窮迴圈）時視為錯誤，刪掉寫到一半的結果檔。
+    """
+    summary = {"program": program_path, "output": result_path(program_path, output_dir)}
+    try:
+        program = load_program(program_path)
+        with OutputWriter(summary["output"]) as output:
+            pipeline = Pipeline(tracer=SILENT, output=output, program=program)
+            finished = advance(pipeline, program, until_cycle=max_cycles)
+            if finished:
+                # 已經跑完，這裡只加上最終狀態與總 cycle 數
+                run_pipeline(pipeline, program, counters=counters_path(summary["output"]))
+        if not finished:
+            os.remove(summary["output"])
+            summary["error"] = f"did not finish within {max_cycles} cycles"
+            return summary
+    except (OSError, ValueError, IndexError) as error:
+        summary["error"] = f"{type(error).__name__}: {error}"
+        return summary
+
+    summary.update(instructions=len(program), cycles=pipeline.cycle,
+                   stalls=pipeline.stall_cycles, flushes=pipeline.flush_count)
+    return summary
+
+def _simulate_chunk(args):
+    paths, output_dir, max_cycles = args
+    return [simulate_file(path, output_dir, max_cycles) for path in paths]
+
+def run_batch(paths, output_dir="outputs", jobs=None, max_cycles=MAX_CYCLES):
+    """用 process pool 平行模擬多個程式檔，每個 core 一個 worker"""
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(paths) <= 1:
+        return [simulate_file(path, output_dir, max_cycles) for path in paths]
+
+    # 小檔案很多時，每個工作包含一批檔案以降低行程間通訊的成本
+    chunk_size = max(1, len(paths) // (jobs * 4))
+    chunks = [(paths[i:i + chunk_size], output_dir, max_cycles) for i in range(0, len(paths), chunk_size)]
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for chunk_result in executor.map(_simulate_chunk, chunks):
+            results.extend(chunk_result)
+    return results
+
+def format_summary(results):
+    """將 run_batch 的結果排成表格"""
+    width = max([len("program")] + [len(result["program"]) for result in results])
+    lines = [f"{'program':<{width}} {'instrs':>8} {'cycles':>10} {'stalls':>8} {'flushes':>8}"]
+    for result in results:
+        if "error" in result:
+            lines.append(f"{result['program']:<{width}} {result['error']}")
+        else:
+            lines.append(f"{result['program']:<{width}} {result['instructions']:>8} {result['cycles']:>10} "
+                         f"{result['stalls']:>8} {result['flushes']:>8}")
+    return "\n".join(lines)
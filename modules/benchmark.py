@@ -0,0 +1,156 @@
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.io_handler import NullOutput
+from modules.pipeline import Pipeline
+from modules.profiler import StageProfiler
+from modules.program import Program
+from modules.simulator import run_pipeline
+from modules.trace import SILENT
+from modules.workloads import GENERATORS
+
+# 各規模的大約動態指令數
+SIZES = {
+    "small": [500],
+    "medium": [500, 20000],
+    "large": [500, 20000, 200000],
+    "huge": [500, 20000, 200000, 2000000],
+}
+
+
+def run_workload(kind, size, seed=0, stages=False):
+    """在目前的行程中跑一個 workload，回傳量測結果"""
+    lines = GENERATORS[kind](size, seed)
+    start = time.perf_counter()
+    program = Program.from_lines(lines)
+    compile_time = time.perf_counter() - start
+
+    pipeline = Pipeline(tracer=SILENT, output=NullOutput(), program=program)
+    profiler = StageProfiler() if stages else None
+    if profiler is not None:
+        profiler.attach(pipeline)
+    start = time.perf_counter()
+    run_pipeline(pipeline, program)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "workload": f"{kind}-{size}",
+        "kind": kind,
+        "size": size,
+        "static_instructions": len(program),
+        "retired": pipeline.retired,
+        "cycles": pipeline.cycle,
+        "compile_seconds": compile_time,
+        "seconds": elapsed,
+        "cycles_per_second": pipeline.cycle / elapsed if elapsed else 0.0,
+        # Linux 上 ru_maxrss 的單位是 KB
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if profiler is not None:
+        result["stage_seconds"] = profiler.stage_seconds()
+    return result
+
+
+def run_suite(sizes=("medium",), kinds=None, seed=0, stages=False):
+    """每個 workload 在獨立的子行程中執行，峰值記憶體才不會互相影響"""
+    kinds = kinds or sorted(GENERATORS)
+    results = []
+    for size_name in sizes:
+        for size in SIZES[size_name]:
+            for kind in kinds:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    results.append(executor.submit(run_workload, kind, size, seed, stages).result())
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.10):
+    """比較兩份結果，cycles/s 下降超過 threshold 的 workload 視為退步"""
+    base = {result["workload"]: result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        old = base.get(result["workload"])
+        if old is None or not old["cycles_per_second"]:
+            continue
+        change = result["cycles_per_second"] / old["cycles_per_second"] - 1
+        rows.append({
+            "workload": result["workload"],
+            "baseline": old["cycles_per_second"],
+            "current": result["cycles_per_second"],
+            "change": change,
+            "regression": change < -threshold,
+        })
+    return rows
+
+
+def format_results(report):
+    lines = [f"{'workload':<20} {'cycles':>10} {'seconds':>9} {'cycles/s':>12} {'peak RSS':>10}"]
+    for result in report["results"]:
+        lines.append(f"{result['workload']:<20} {result['cycles']:>10} {result['seconds']:>9.3f} "
+                     f"{result['cycles_per_second']:>12.0f} {result['peak_rss_kb'] // 1024:>7} MB")
+        for stage, seconds in (result.get("stage_seconds") or {}).items():
+            lines.append(f"    {stage:<26} {seconds * 1000:>10.2f} ms")
+    return "\n".join(lines)
+
+
+def format_comparison(rows, threshold):
+    lines = [f"{'workload':<20} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(f"{row['workload']:<20} {row['baseline']:>12.0f} {row['current']:>12.0f} "
+                     f"{row['change']:>+8.1%}{flag}")
+    lines.append(f"threshold: -{threshold:.0%}")
+    return "\n".join(lines)
+
+
+def _load(file_path):
+    with open(file_path) as file:
+        return json.load(file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="模擬器效能量測")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="跑 benchmark suite")
+    run.add_argument("--size", nargs="+", choices=sorted(SIZES), default=["medium"])
+    run.add_argument("--kind", nargs="+", choices=sorted(GENERATORS), default=None)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--stages", action="store_true", help="另外量測各階段花的時間（會變慢）")
+    run.add_argument("--save", metavar="FILE", help="將結果存成 JSON baseline")
+    run.add_argument("--baseline", metavar="FILE", help="跑完後與這份 baseline 比較")
+    run.add_argument("--threshold", type=float, default=0.10)
+
+    cmp = commands.add_parser("compare", help="比較兩份 JSON 結果")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        report = run_suite(args.size, args.kind, args.seed, args.stages)
+        print(format_results(report))
+        if args.save:
+            with open(args.save, 'w') as file:
+                json.dump(report, file, indent=2)
+        if not args.baseline:
+            return 0
+        baseline, current = _load(args.baseline), report
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+
+    rows = compare(baseline, current, args.threshold)
+    print(format_comparison(rows, args.threshold))
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import argparse
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+
+from modules.program import Program
+
+# 檔案開頭的識別字串與結尾的 trailer
+MAGIC = b"PTRC"
+TRAILER_MAGIC = b"PTRI"
+TRACE_VERSION = 1
+# version, byteorder, index typecode, chunk_rows, start_cycle, rows,
+# program_offset, program_size, index_offset, magic
+TRAILER = struct.Struct("<HBcIqQQQQ4s")
+BYTEORDERS = {"little": 0, "big": 1}
+
+# 每個 cycle 一列，欄位依序為各階段的指令 index（-1 為空）、旗標與 forwarding 信號
+STAGE_COLUMNS = ("wb", "mem", "ex", "id", "if")
+COLUMNS = STAGE_COLUMNS + ("flags", "forward")
+CHUNK_ROWS = 4096
+
+# flags 的位元
+STALL = 1   # ID 因 hazard 停住
+FLUSH = 2   # beq taken 清掉 IF/ID
+HOLD = 4    # ID 顯示剛抓到的 branch 目標，不解碼
+
+FORWARD_CODES = {"00": 0, "01": 1, "10": 2}
+FORWARD_NAMES = ("00", "01", "10")
+
+EMPTY_ROW = (-1, -1, -1, -1, -1, 0, 0)
+
+
+def forward_byte(forward_a, forward_b):
+    return FORWARD_CODES[forward_a] | FORWARD_CODES[forward_b] << 2
+
+
+def column_typecodes(index_typecode):
+    return (index_typecode,) * len(STAGE_COLUMNS) + ("B", "B")
+
+
+def index_typecode(program):
+    """指令 index 的欄位寬度：程式短於 32767 條時用 16 位元"""
+    return "h" if len(program) < 0x7FFF else "i"
+
+
+class BinaryTraceWriter:
+    """以固定寬度的欄位記錄每個 cycle 的管線佔用情形
+
+    提供 append/extend，設成 Pipeline.binary_trace 後每個 cycle 附加一列。
+    每 chunk_rows 列為一個 chunk，chunk 內各欄位連續存放；
+    結束時寫出壓縮過的程式文字、每個 chunk 的位置（cycle index）與 trailer。
+    """
+
+    def __init__(self, file_path, program, chunk_rows=CHUNK_ROWS):
+        self.file_path = file_path
+        self.program = program
+        self.chunk_rows = chunk_rows
+        self.start_cycle = 1
+        self.rows = 0
+        self.index = array('Q')
+        self.index_typecode = index_typecode(program)
+        self.typecodes = column_typecodes(self.index_typecode)
+        self.columns = [array(typecode) for typecode in self.typecodes]
+        self.file = open(file_path, 'wb')
+        self.file.write(MAGIC)
+
+    def append(self, row):
+        for column, value in zip(self.columns, row):
+            column.append(value)
+        self.rows += 1
+        if len(self.columns[0]) >= self.chunk_rows:
+            self.flush_chunk()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def flush_chunk(self):
+        if not self.columns[0]:
+            return
+        # chunk 從 8 的倍數開始，mmap 後各欄位直接 cast 時都是對齊的
+        self.file.write(b"\0" * (-self.file.tell() % 8))
+        self.index.append(self.file.tell())
+        for column in self.columns:
+            column.tofile(self.file)
+        self.columns = [array(typecode) for typecode in self.typecodes]
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush_chunk()
+        program = zlib.compress("\n".join(self.program.lines()).encode())
+        program_offset = self.file.tell()
+        self.file.write(program)
+        index_offset = self.file.tell()
+        self.index.tofile(self.file)
+        self.file.write(TRAILER.pack(TRACE_VERSION, BYTEORDERS[sys.byteorder],
+                                     self.index_typecode.encode(), self.chunk_rows,
+                                     self.start_cycle, self.rows, program_offset, len(program),
+                                     index_offset, TRAILER_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class BinaryTraceReader:
+    """以 mmap 讀取 BinaryTraceWriter 寫出的檔案，任意 cycle 範圍都直接算出位置讀取"""
+
+    def __init__(self, file_path):
+        self.file = open(file_path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC or len(self.map) < len(MAGIC) + TRAILER.size:
+            raise ValueError(f"Not a binary trace: {file_path}")
+        (version, byteorder, typecode, self.chunk_rows, self.start_cycle, self.rows, program_offset,
+         program_size, index_offset, magic) = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        if magic != TRAILER_MAGIC or version != TRACE_VERSION:
+            raise ValueError(f"Unsupported binary trace: {file_path}")
+        if byteorder != BYTEORDERS[sys.byteorder]:
+            raise ValueError("Binary trace was written on a machine with a different byte order")
+        self.typecodes = column_typecodes(typecode.decode())
+        self.index = array('Q')
+        self.index.frombytes(self.map[index_offset:len(self.map) - TRAILER.size])
+        text = zlib.decompress(self.map[program_offset:program_offset + program_size]).decode()
+        self.program = Program.from_lines(text.split("\n") if text else [])
+
+    def __len__(self):
+        return self.rows
+
+    def _chunk_columns(self, number):
+        """第 number 個 chunk 各欄位的 memoryview，不複製資料"""
+        rows = min(self.chunk_rows, self.rows - number * self.chunk_rows)
+        offset = self.index[number]
+        view = memoryview(self.map)
+        columns = []
+        for typecode in self.typecodes:
+            size = rows * array(typecode).itemsize
+            columns.append(view[offset:offset + size].cast(typecode))
+            offset += size
+        return columns
+
+    def rows_between(self, start, stop):
+        """第 start 到 stop - 1 列（從 0 算起）的 tuple"""
+        start = max(start, 0)
+        stop = min(stop, self.rows)
+        while start < stop:
+            number = start // self.chunk_rows
+            base = number * self.chunk_rows
+            end = min(stop, base + self.chunk_rows)
+            columns = self._chunk_columns(number)
+            yield from zip(*(column[start - base:end - base] for column in columns))
+            start = end
+
+    def cycles(self, first, last=None):
+        """輸出中 Cycle first 到 Cycle last（含）的 (cycle, row)"""
+        last = first if last is None else last
+        start = first - self.start_cycle
+        for offset, row in enumerate(self.rows_between(start, last - self.start_cycle + 1)):
+            yield max(start, 0) + offset + self.start_cycle, row
+
+    def text_lines(self, first=None, last=None):
+        """還原成 Pipeline.output 的逐 cycle 文字"""
+        first = self.start_cycle if first is None else first
+        last = self.start_cycle + self.rows - 1 if last is None else last
+        program = self.program
+        for cycle, row in self.cycles(first, last):
+            yield f"Cycle {cycle}"
+            wb, mem, ex, decode, fetch, flags, _ = row
+            if wb >= 0:
+                yield program[wb].lines.write_back
+            if mem >= 0:
+                yield program[mem].lines.memory
+            if ex >= 0:
+                yield program[ex].lines.execute
+            if decode >= 0:
+                yield program[decode].lines.hold if flags & HOLD else program[decode].lines.decode
+            if fetch >= 0:
+                yield program[fetch].lines.fetch
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def format_row(cycle, row):
+    wb, mem, ex, decode, fetch, flags, forward = row
+    marks = "".join(name for bit, name in ((STALL, " stall"), (FLUSH, " flush"), (HOLD, " hold")) if flags & bit)
+    return (f"{cycle:>10}  IF {fetch:>6} ID {decode:>6} EX {ex:>6} MEM {mem:>6} WB {wb:>6}  "
+            f"ForwardA={FORWARD_NAMES[forward & 3]} ForwardB={FORWARD_NAMES[forward >> 2]}{marks}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="讀取二進位管線追蹤檔")
+    parser.add_argument("trace", help="--binary-trace 寫出的檔案")
+    parser.add_argument("--first", type=int, default=None, help="第一個 cycle")
+    parser.add_argument("--last", type=int, default=None, help="最後一個 cycle（含）")
+    parser.add_argument("--text", action="store_true", help="還原成結果檔中的逐 cycle 文字")
+    parser.add_argument("-o", "--output", help="寫到檔案而不是標準輸出")
+    args = parser.parse_args(argv)
+
+    with BinaryTraceReader(args.trace) as reader:
+        first = reader.start_cycle if args.first is None else args.first
+        last = reader.start_cycle + len(reader) - 1 if args.last is None else args.last
+        if args.text:
+            lines = reader.text_lines(first, last)
+        else:
+            lines = (format_row(cycle, row) for cycle, row in reader.cycles(first, last))
+        file = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            for line in lines:
+                file.write(line + "\n")
+        finally:
+            if args.output:
+                file.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import pickle
+import zlib
+
+CHECKPOINT_VERSION = 5
+
+def save_checkpoint(pipeline, file_path, output_offset=None):
+    """將完整管線狀態壓縮後寫入 checkpoint 檔
+
+    output_offset 是當下輸出檔已寫出的長度，接續時會截斷到這個位置，
+    讓接續的結果與一次跑完的輸出完全相同。
+    """
+    payload = {
+        "version": CHECKPOINT_VERSION,
+        "program": pipeline.program.digest,
+        "output_offset": output_offset,
+        "state": pipeline.get_state(),
+    }
+    data = zlib.compress(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+    # 先寫暫存檔再改名，中途被中止也不會留下壞掉的 checkpoint
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, file_path)
+
+def load_checkpoint(file_path):
+    """讀取 checkpoint 檔"""
+    with open(file_path, 'rb') as file:
+        payload = pickle.loads(zlib.decompress(file.read()))
+    if payload.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version: {payload.get('version')}")
+    return payload
+
+def restore_pipeline(pipeline, payload):
+    """將 load_checkpoint 的內容套用到以同一個程式建立的 pipeline"""
+    if payload["program"] != pipeline.program.digest:
+        raise ValueError("Checkpoint was taken from a different program")
+    pipeline.set_state(payload["state"])
+    return pipeline
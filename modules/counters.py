@@ -0,0 +1,94 @@
+import json
+import os
+
+
+class PerfCounters:
+    """管線事件計數，欄位都是整數，模擬時直接 += 1，關不關都一樣便宜
+
+    stall 依原因分成 load-use、branch（beq 比較的來源還沒算好）與 data（關閉 forwarding 時等待寫回），
+    forwarding 依來源（EX/MEM 或 MEM/WB）與運算元（A 或 B）分開計算。
+    cycle、完成的指令數與 stall/flush 總數仍記在 Pipeline 上。
+    """
+
+    FIELDS = ("load_use_stalls", "branch_stalls", "data_stalls",
+              "taken_branches", "not_taken_branches", "flushed_slots",
+              "forward_ex_mem_a", "forward_ex_mem_b", "forward_mem_wb_a", "forward_mem_wb_b")
+    __slots__ = FIELDS
+
+    def __init__(self, **values):
+        for name in self.FIELDS:
+            setattr(self, name, values.pop(name, 0))
+        if values:
+            raise TypeError(f"Unknown counters: {', '.join(values)}")
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def copy(self):
+        return PerfCounters(**self.as_dict())
+
+    def difference(self, other):
+        """self - other，用來算一段模擬中各事件的增量"""
+        return PerfCounters(**{name: getattr(self, name) - getattr(other, name) for name in self.FIELDS})
+
+    def add(self, other, n=1):
+        """加上 n 倍的 other（迴圈記憶化跳過 n 圈時使用）"""
+        for name in self.FIELDS:
+            setattr(self, name, getattr(self, name) + n * getattr(other, name))
+
+    def __repr__(self):
+        return f"PerfCounters({self.as_dict()})"
+
+
+def cpi_stack(pipeline):
+    """將總 cycle 數依原因分配，回傳 [(名稱, 每條指令平均的 cycle 數)]
+
+    base 為每條完成的指令 1 個 cycle，branch flush 為被丟掉的 IF/ID，
+    剩下的（管線填滿與清空等）歸到 other。
+    """
+    retired = pipeline.retired
+    if not retired:
+        return []
+    counters = pipeline.counters
+    parts = [
+        ("base", retired),
+        ("load-use stall", counters.load_use_stalls),
+        ("branch stall", counters.branch_stalls),
+        ("data stall", counters.data_stalls),
+        ("branch flush", counters.flushed_slots),
+    ]
+    parts.append(("other", pipeline.cycle - sum(cycles for _, cycles in parts)))
+    return [(name, cycles / retired) for name, cycles in parts]
+
+
+def format_cpi_stack(stack):
+    lines = ["CPI stack:"]
+    for name, cpi in stack:
+        lines.append(f"  {name:<16} {cpi:>7.3f}")
+    lines.append(f"  {'total':<16} {sum(cpi for _, cpi in stack):>7.3f}")
+    return "\n".join(lines)
+
+
+def counters_report(pipeline):
+    """整理成可序列化的 dict：總計、各事件計數與 CPI stack"""
+    report = {
+        "cycles": pipeline.cycle,
+        "retired": pipeline.retired,
+        "cpi": pipeline.cycle / pipeline.retired if pipeline.retired else 0.0,
+        "stall_cycles": pipeline.stall_cycles,
+        "flushes": pipeline.flush_count,
+    }
+    report.update(pipeline.counters.as_dict())
+    report["cpi_stack"] = dict(cpi_stack(pipeline))
+    return report
+
+
+def counters_path(output_path):
+    """outputs/result_test3.txt -> outputs/result_test3.counters.json"""
+    return os.path.splitext(output_path)[0] + ".counters.json"
+
+
+def write_counters(pipeline, file_path):
+    with open(file_path, 'w') as file:
+        json.dump(counters_report(pipeline), file, indent=2)
+        file.write("\n")
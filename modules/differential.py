@@ -0,0 +1,104 @@
+import argparse
+import glob
+import itertools
+import os
+import sys
+import tempfile
+
+from modules.bintrace import BinaryTraceReader, BinaryTraceWriter
+from modules.pipeline import Pipeline
+from modules.program import Program, load_program
+from modules.simulator import advance
+from modules.threaded import compile_stages
+from modules.trace import SILENT
+from modules.workloads import GENERATORS
+
+# 各 backend 都要跑過的管線設定
+VARIANTS = [
+    dict(forwarding=forwarding, branch_stage=branch_stage, load_use=load_use)
+    for forwarding, branch_stage, load_use in itertools.product((True, False), ("EX", "ID"), ("stall", "forward"))
+]
+MAX_CYCLES = 1_000_000
+# 曾經出錯的小程式
+REGRESSIONS = {
+    # 同一個 cycle 既 stall 又有 beq taken，ID 印的是解碼而不是 hold
+    "stall-and-taken-beq": ["lw $1, 0($0)", "beq $2, $2, 1", "beq $1, $3, 1",
+                            "add $4, $4, $4", "add $5, $5, $5"],
+}
+
+
+def run_backend(backend, program, config, loop_memo=True):
+    """以指定的 backend 跑完 program，回傳要比對的結果
+
+    同時寫一份二進位追蹤，binary_trace 為它還原的逐 cycle 文字。
+    """
+    output = []
+    pipeline = Pipeline(tracer=SILENT, output=output, program=program, loop_memo=loop_memo,
+                        backend=backend, **config)
+    if pipeline.stages is not None:
+        # 平常只編譯迴圈內的指令，這裡全部編譯，合成的直線程式也能比對到編譯後的函式
+        pipeline.stages = compile_stages(program, range(len(program)))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.bin")
+        with BinaryTraceWriter(path, program) as writer:
+            pipeline.binary_trace = writer
+            finished = advance(pipeline, program, until_cycle=MAX_CYCLES)
+        with BinaryTraceReader(path) as reader:
+            text = list(reader.text_lines())
+    return {
+        "finished": finished,
+        "cycle": pipeline.cycle,
+        "retired": pipeline.retired,
+        "registers": list(pipeline.registers),
+        "memory": list(pipeline.memory),
+        "counters": pipeline.counters.as_dict(),
+        "output": output,
+        "binary_trace": text,
+    }
+
+
+def compare(program, config, loop_memo=True, reference="interp", candidate="threaded"):
+    """兩個 backend 結果不同的欄位名稱，二進位追蹤還原的文字與輸出不同時另外列出"""
+    expected = run_backend(reference, program, config, loop_memo)
+    actual = run_backend(candidate, program, config, loop_memo)
+    mismatched = [name for name in expected if expected[name] != actual[name]]
+    if any(result["binary_trace"] != result["output"] for result in (expected, actual)):
+        mismatched.append("binary_trace text")
+    return mismatched
+
+
+def programs(paths, generated, seeds):
+    """要比對的 (名稱, Program)：給定的程式檔、REGRESSIONS 與各種合成程式"""
+    for path in paths:
+        yield path, load_program(path, cache=False)
+    for name, lines in REGRESSIONS.items():
+        yield name, Program.from_lines(lines)
+    for kind in sorted(GENERATORS):
+        for size in generated:
+            for seed in range(seeds):
+                yield f"{kind}-{size}-{seed}", Program.from_lines(GENERATORS[kind](size, seed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比對 threaded 與直譯 backend 的 registers、memory 與 cycle 數，"
+                                                 "並確認二進位追蹤還原的文字與輸出相同")
+    parser.add_argument("programs", nargs="*", default=None, help="程式檔，預設為 inputs/*.txt")
+    parser.add_argument("--size", nargs="+", type=int, default=[50, 500], help="合成程式的大小")
+    parser.add_argument("--seeds", type=int, default=5, help="每種合成程式產生幾個")
+    args = parser.parse_args(argv)
+
+    paths = args.programs or sorted(glob.glob("inputs/*.txt"))
+    checked = failed = 0
+    for name, program in programs(paths, args.size, args.seeds):
+        for config, loop_memo in itertools.product(VARIANTS, (True, False)):
+            checked += 1
+            mismatched = compare(program, config, loop_memo)
+            if mismatched:
+                failed += 1
+                print(f"MISMATCH {name} {config} loop_memo={loop_memo}: {', '.join(mismatched)}")
+    print(f"{checked} runs, {failed} mismatches")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
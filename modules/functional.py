@@ -0,0 +1,39 @@
+from modules.isa import OP_ADD, OP_SUB, OP_LW, OP_SW, OP_BEQ
+from modules.memory import to_word
+
+def run_functional(pipeline, program, start=0, max_instructions=None):
+    """不模擬管線，直接在 pipeline 的 registers/memory 上逐條執行 Program 的指令
+
+    每條指令只跑一次迴圈，回傳 (下一條指令的 index, 執行的指令數)。
+    max_instructions 為 None 時執行到程式結束。
+    """
+    registers = pipeline.registers
+    memory = pipeline.memory
+    instructions = program.instructions
+    targets = program.targets
+    end = len(instructions)
+    pc = start
+    count = 0
+    limit = max_instructions if max_instructions is not None else -1
+
+    while pc < end and count != limit:
+        instruction = instructions[pc]
+        pc += 1
+        if instruction is None:
+            continue
+        count += 1
+        opcode = instruction.opcode
+
+        if opcode == OP_ADD:
+            registers[instruction.rd] = registers[instruction.rs] + registers[instruction.rt]
+        elif opcode == OP_SUB:
+            registers[instruction.rd] = registers[instruction.rs] - registers[instruction.rt]
+        elif opcode == OP_LW:
+            registers[instruction.reg] = memory[registers[instruction.base] + instruction.offset // 4]
+        elif opcode == OP_SW:
+            memory[registers[instruction.base] + instruction.offset // 4] = to_word(registers[instruction.reg])
+        elif opcode == OP_BEQ:
+            if registers[instruction.rs] == registers[instruction.rt]:
+                pc = targets[pc - 1]
+
+    return pc, count
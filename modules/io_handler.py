@@ -6,12 +6,74 @@ def load_instructions(file_path):
         instructions = [line.strip() for line in file.readlines()]
     return instructions
 
-def save_output(results, file_path):
-    """將模擬結果存入檔案"""
+def _ensure_dir(file_path):
     output_dir = os.path.dirname(file_path)
-    if not os.path.exists(output_dir):
+    if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    with open(file_path, 'w') as file:
-        for line in results:
-            file.write(line + "\n")
+class OutputWriter:
+    """邊模擬邊寫出結果的緩衝寫入器
+
+    提供 append/extend，可以直接當作 Pipeline.output 使用。
+    緩衝滿了就把完整的行一次寫出並 flush，
+    因此中途被中止時檔案內仍是完整的前綴。
+    """
+
+    def __init__(self, file_path, buffer_lines=4096, offset=None):
+        _ensure_dir(file_path)
+        self.file_path = file_path
+        self.buffer_lines = buffer_lines
+        self.buffer = []
+        if offset is None:
+            self.file = open(file_path, 'w')
+        else:
+            # 從 checkpoint 接續：丟掉 offset 之後的內容再續寫
+            os.truncate(file_path, offset)
+            self.file = open(file_path, 'a')
+
+    def append(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.buffer_lines:
+            self.flush()
+
+    def extend(self, lines):
+        self.buffer.extend(lines)
+        if len(self.buffer) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.buffer.append("")
+            self.file.write("\n".join(self.buffer))
+            self.buffer.clear()
+        self.file.flush()
+
+    def tell(self):
+        """寫出緩衝後回傳目前檔案長度"""
+        self.flush()
+        return self.file.tell()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class NullOutput:
+    """丟棄所有輸出，只需要最終狀態時使用"""
+
+    def append(self, line):
+        pass
+
+    def extend(self, lines):
+        pass
+
+def save_output(results, file_path):
+    """將模擬結果存入檔案"""
+    with OutputWriter(file_path) as writer:
+        writer.extend(results)
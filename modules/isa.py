@@ -0,0 +1,129 @@
+import re
+from collections import namedtuple
+
+# opcode 編號
+OP_ADD = 0
+OP_SUB = 1
+OP_LW = 2
+OP_SW = 3
+OP_BEQ = 4
+
+OPCODES = {"add": OP_ADD, "sub": OP_SUB, "lw": OP_LW, "sw": OP_SW, "beq": OP_BEQ}
+
+
+# 控制信號的欄位順序與原本 decode 中的 control_signals 相同
+ControlSignals = namedtuple("ControlSignals", ("RegDst", "ALUSrc", "Branch", "MemRead",
+                                               "MemWrite", "RegWrite", "MemtoReg", "ALUOp"),
+                            defaults=("X",) * 8)
+
+# 每個 opcode 共用一份唯讀的控制信號表
+CONTROL_SIGNALS = {
+    "add": ControlSignals(RegDst="1", ALUSrc="0", Branch="0", MemRead="0", MemWrite="0",
+                          RegWrite="1", MemtoReg="0", ALUOp="10"),
+    "sub": ControlSignals(RegDst="1", ALUSrc="0", Branch="0", MemRead="0", MemWrite="0",
+                          RegWrite="1", MemtoReg="0", ALUOp="11"),
+    "lw": ControlSignals(RegDst="0", ALUSrc="1", Branch="0", MemRead="1", MemWrite="0",
+                         RegWrite="1", MemtoReg="1"),
+    "sw": ControlSignals(ALUSrc="1", Branch="0", MemRead="0", MemWrite="1", RegWrite="0"),
+    "beq": ControlSignals(ALUSrc="0", Branch="1", MemRead="0", MemWrite="0", RegWrite="0",
+                          ALUOp="01"),
+}
+
+# 每個階段寫進輸出檔的那一行只與 opcode 有關，事先組好
+StageLines = namedtuple("StageLines", ("fetch", "hold", "decode", "execute", "memory", "write_back"))
+
+
+def _stage_lines(op, control):
+    return StageLines(
+        fetch=f"{op}: IF",
+        hold=f"{op}: IF ",
+        decode=f"{op}: ID ",
+        execute=(f"{op}: EX RegDst:{control.RegDst} ALUSrc:{control.ALUSrc} Branch:{control.Branch} "
+                 f"MemRead:{control.MemRead} MemWrite:{control.MemWrite} RegWrite:{control.RegWrite} "
+                 f"MemtoReg:{control.MemtoReg}"),
+        memory=(f"{op}: MEM Branch:{control.Branch} MemRead:{control.MemRead} MemWrite:{control.MemWrite} "
+                f"RegWrite:{control.RegWrite} MemtoReg:{control.MemtoReg}"),
+        write_back=f"{op}: WB RegWrite:{control.RegWrite} MemtoReg:{control.MemtoReg}",
+    )
+
+
+STAGE_LINES = {op: _stage_lines(op, control) for op, control in CONTROL_SIGNALS.items()}
+
+_MEM_OPERANDS = re.compile(r'\$(\d+),\s*(\d+)\(\$(\d+)\)')
+
+
+class Instruction:
+    """解碼後的指令，不適用的欄位為 None"""
+    __slots__ = ("text", "op", "opcode", "rs", "rt", "rd", "reg", "base", "offset",
+                 "control", "lines")
+
+    def __init__(self, text, op, rs=None, rt=None, rd=None, reg=None, base=None, offset=None):
+        self.text = text
+        self.op = op
+        self.opcode = OPCODES[op]
+        self.rs = rs
+        self.rt = rt
+        self.rd = rd
+        self.reg = reg
+        self.base = base
+        self.offset = offset
+        self.control = CONTROL_SIGNALS[op]
+        self.lines = STAGE_LINES[op]
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"Instruction({self.text!r})"
+
+
+def parse_instruction(text):
+    """將一行組合語言解析成 Instruction"""
+    parts = text.split()
+    op = parts[0]
+
+    if op == "beq":
+        rs = int(parts[1][1:].replace(",", ""))
+        rt = int(parts[2][1:].replace(",", ""))
+        offset = int(parts[3])
+        return Instruction(text, op, rs=rs, rt=rt, offset=offset)
+
+    elif op in ["add", "sub"]:
+        rd = int(parts[1][1:].replace(",", ""))
+        rs = int(parts[2][1:].replace(",", ""))
+        rt = int(parts[3][1:].replace(",", ""))
+        return Instruction(text, op, rd=rd, rs=rs, rt=rt)
+
+    elif op in ["lw", "sw"]:
+        match = _MEM_OPERANDS.match(" ".join(parts[1:]))
+        if match:
+            return Instruction(text, op, reg=int(match.group(1)),
+                               offset=int(match.group(2)), base=int(match.group(3)))
+
+    raise ValueError(f"Unsupported instruction: {text}")
+
+
+# 相同內容的指令共用同一個 Instruction 物件
+_decoded_cache = {}
+# 表滿了就清空，常駐的行程（modules.service）不斷解碼新程式時記憶體才不會一直長大
+DECODE_CACHE_SIZE = 16384
+
+
+def decode_line(line):
+    """解碼單行指令，空行回傳 None，已解碼的 Instruction 直接回傳"""
+    if line is None or isinstance(line, Instruction):
+        return line
+    text = line.strip()
+    if not text:
+        return None
+    instruction = _decoded_cache.get(text)
+    if instruction is None:
+        if len(_decoded_cache) >= DECODE_CACHE_SIZE:
+            _decoded_cache.clear()
+        instruction = _decoded_cache[text] = parse_instruction(text)
+    return instruction
+
+
+def compile_program(lines):
+    """一次將 load_instructions 讀進來的所有行解碼"""
+    return [decode_line(line) for line in lines]
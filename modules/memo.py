@@ -0,0 +1,412 @@
+import copy
+from collections import OrderedDict
+from types import MethodType
+
+from modules.io_handler import NullOutput
+from modules.trace import SILENT
+
+# 記錄一圈迴圈時最多模擬幾個 cycle，超過就當成無法摘要
+MAX_RECORD_CYCLES = 10000
+# 沒有任何條件限制（無窮迴圈）時，一次最多跳過幾圈
+MAX_SKIP = 1 << 20
+LATCHES = ("ID_EX", "EX_MEM", "MEM_WB")
+LATCH_VALUES = ("result", "data", "address")
+
+
+class Sym:
+    """記錄一圈迴圈時使用的符號值：具體值 value 加上仿射式 const + Σ coef*var
+
+    var 是迴圈開頭的狀態（暫存器、記憶體、latch 欄位）。
+    比較運算回傳具體結果，並把條件記到 recorder，之後用來判斷能跳過幾圈。
+    """
+    __slots__ = ("value", "const", "coefs", "recorder")
+
+    def __init__(self, value, const, coefs, recorder):
+        self.value = value
+        self.const = const
+        self.coefs = coefs
+        self.recorder = recorder
+
+    @classmethod
+    def var(cls, name, value, recorder):
+        return cls(value, 0, {name: 1}, recorder)
+
+    def _combine(self, other, sign):
+        if isinstance(other, Sym):
+            coefs = dict(self.coefs)
+            for name, coef in other.coefs.items():
+                coef = coefs.get(name, 0) + sign * coef
+                if coef:
+                    coefs[name] = coef
+                else:
+                    del coefs[name]
+            return Sym(self.value + sign * other.value, self.const + sign * other.const,
+                       coefs, self.recorder)
+        if isinstance(other, int):
+            return Sym(self.value + sign * other, self.const + sign * other, self.coefs, self.recorder)
+        return NotImplemented
+
+    def __add__(self, other):
+        return self._combine(other, 1)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self._combine(other, -1)
+
+    def __rsub__(self, other):
+        return self.__neg__() + other
+
+    def __neg__(self):
+        return Sym(-self.value, -self.const, {name: -coef for name, coef in self.coefs.items()},
+                   self.recorder)
+
+    def _record(self, form, relation, outcome):
+        """記下 form 的條件：eq 為 form == 0，ge 為 form >= 0，outcome 為這次的結果"""
+        if isinstance(form, Sym) and form.coefs:
+            self.recorder.append((form, relation, outcome))
+
+    def __eq__(self, other):
+        if not isinstance(other, (Sym, int)):
+            return NotImplemented
+        result = self.value == getattr(other, "value", other)
+        self._record(self - other, "eq", result)
+        return result
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __ge__(self, other):
+        result = self.value >= getattr(other, "value", other)
+        self._record(self - other, "ge", result)
+        return result
+
+    def __le__(self, other):
+        result = self.value <= getattr(other, "value", other)
+        self._record(other - self, "ge", result)
+        return result
+
+    def __gt__(self, other):
+        result = self.value > getattr(other, "value", other)
+        self._record(self - other - 1, "ge", result)
+        return result
+
+    def __lt__(self, other):
+        result = self.value < getattr(other, "value", other)
+        self._record(other - self - 1, "ge", result)
+        return result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Sym({self.value})"
+
+
+class SymbolicMemory:
+    """在真正的記憶體上疊一層，讀到的字組變成變數，寫入只記在這一層"""
+
+    def __init__(self, memory, recorder):
+        self.memory = memory
+        self.recorder = recorder
+        self.cells = {}
+        self.loaded = []  # 讀過的位址，其初始值是迴圈開頭狀態的一部分
+
+    def _address(self, address):
+        if isinstance(address, Sym):
+            # 位址必須每圈都相同
+            address._record(address - address.value, "eq", True)
+            address = address.value
+        if not 0 <= address < len(self.memory):
+            raise IndexError(f"memory address {address} out of range")
+        return address
+
+    def __getitem__(self, address):
+        address = self._address(address)
+        value = self.cells.get(address)
+        if value is None:
+            value = self.cells[address] = Sym.var(("m", address), self.memory[address], self.recorder)
+            self.loaded.append(address)
+        return value
+
+    def __setitem__(self, address, value):
+        self.cells[self._address(address)] = value
+
+    def __len__(self):
+        return len(self.memory)
+
+
+def evaluate(form, values):
+    if not isinstance(form, Sym):
+        return form
+    return form.const + sum(coef * values[name] for name, coef in form.coefs.items())
+
+
+def first_failure(value, slope, relation, outcome):
+    """條件在第 n 圈的值為 value + slope*(n-1)，回傳第一個結果與 outcome 不同的 n（n >= 1），不會改變時為 None"""
+    if relation == "eq":
+        if outcome:
+            if value != 0:
+                return 1
+            return 2 if slope else None
+        if value == 0:
+            return 1
+        if slope and -value % slope == 0 and -value // slope > 0:
+            return 1 + -value // slope
+        return None
+    # ge：value < 0 等價於 -value-1 >= 0
+    if not outcome:
+        value, slope = -value - 1, -slope
+    if value < 0:
+        return 1
+    if slope >= 0:
+        return None
+    return 2 + value // -slope
+
+
+class LoopSummary:
+    """一圈迴圈的效果：各計數的增量、每個 cycle 的輸出，以及狀態的轉移
+
+    轉移只接受三種形式，跳過 n 圈後每個值都是 n 的一次式：
+      invariant    不變
+      accumulate   v + h，h 只用到不變的值
+      derived      只用到前兩類的值重新算出
+    """
+
+    def __init__(self, start_vars, transfer, constraints, steps, deltas, counters, rows=None):
+        self.start_vars = start_vars
+        self.constraints = constraints
+        self.steps = steps
+        self.deltas = deltas
+        self.counters = counters
+        self.rows = rows
+        self.accumulate = {}
+        self.derived = {}
+        invariant = {name for name in start_vars
+                     if name not in transfer or _is_identity(transfer[name], name)}
+        for name, form in transfer.items():
+            if name in invariant or name not in start_vars:
+                continue
+            coefs = dict(getattr(form, "coefs", {}))
+            if coefs.pop(name, 0) == 1 and all(other in invariant for other in coefs):
+                self.accumulate[name] = form - Sym.var(name, 0, None)
+        known = invariant | set(self.accumulate)
+        for name, form in transfer.items():
+            if name in known:
+                continue
+            if not all(other in known for other in getattr(form, "coefs", ())):
+                raise ValueError(f"cannot summarize {name}")
+            self.derived[name] = form
+
+    def state_at(self, start, n):
+        """從 start 開始跑 n 圈之後的值"""
+        if n == 0:
+            return start
+        steps = {name: evaluate(step, start) for name, step in self.accumulate.items()}
+        previous = dict(start)
+        for name, step in steps.items():
+            previous[name] = start[name] + (n - 1) * step
+        state = dict(start)
+        for name, form in self.derived.items():
+            state[name] = evaluate(form, previous)
+        for name, step in steps.items():
+            state[name] = start[name] + n * step
+        return state
+
+    def iterations(self, start, limit):
+        """從 start 開始，最多能照同樣路徑跑幾圈（不超過 limit）"""
+        first = self.state_at(start, 1)
+        second = self.state_at(start, 2)
+        for form, relation, outcome in self.constraints:
+            value = evaluate(form, start)
+            holds = value == 0 if relation == "eq" else value >= 0
+            if holds != outcome:
+                return 0
+            value = evaluate(form, first)
+            failure = first_failure(value, evaluate(form, second) - value, relation, outcome)
+            if failure is not None:
+                limit = min(limit, failure)
+        return limit
+
+
+def _is_identity(form, name):
+    return isinstance(form, Sym) and form.const == 0 and form.coefs == {name: 1}
+
+
+def control_key(pipeline):
+    """迴圈開頭的控制狀態，相同時接下來的路徑只由資料決定"""
+    latches = tuple(None if latch is None else (latch.index, latch.rd, latch.taken)
+                    for latch in (pipeline.ID_EX, pipeline.EX_MEM, pipeline.MEM_WB))
+    return (pipeline.simulate_pipeline_index, pipeline.IF_ID_index, pipeline.stall_counter,
+            pipeline.ForwardA, pipeline.ForwardB, pipeline.if_taken, latches)
+
+
+def read_state(pipeline, names):
+    values = {}
+    for name in names:
+        kind, where = name
+        if kind == "r":
+            values[name] = pipeline.registers[where]
+        elif kind == "m":
+            values[name] = pipeline.memory[where]
+        else:
+            values[name] = getattr(getattr(pipeline, kind), where)
+    return values
+
+
+def write_state(pipeline, values):
+    for name, value in values.items():
+        kind, where = name
+        if kind == "r":
+            pipeline.registers[where] = value
+        elif kind == "m":
+            pipeline.memory[where] = value
+        else:
+            setattr(getattr(pipeline, kind), where, value)
+
+
+class LoopMemo:
+    """往回跳的 beq 造成的迴圈記憶化
+
+    每次 beq 往回跳時以控制狀態為 key 查表，沒有就用符號值在 pipeline 的
+    副本上記錄一圈；之後同樣的迴圈開頭直接算出能照同樣路徑跑幾圈並一次跳過，
+    輸出則重播記錄下來的每個 cycle。表的大小有上限，以 LRU 淘汰。
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.summaries = OrderedDict()
+        self.skipped_iterations = 0
+        self.skipped_cycles = 0
+
+    def lookup(self, key):
+        if key in self.summaries:
+            self.summaries.move_to_end(key)
+            return self.summaries[key], True
+        return None, False
+
+    def store(self, key, summary):
+        self.summaries[key] = summary
+        if len(self.summaries) > self.capacity:
+            self.summaries.popitem(last=False)
+
+    def loop_head(self, pipeline, program, next_cycle, until_cycle=None, until_retired=None):
+        """在迴圈開頭嘗試跳過數圈，回傳跳過的圈數"""
+        key = control_key(pipeline)
+        summary, found = self.lookup(key)
+        if not found:
+            summary = record_iteration(pipeline, program, next_cycle, key)
+            self.store(key, summary)
+        if summary is None:
+            return 0
+
+        cycles, stalls, flushes, retired = summary.deltas
+        limit = MAX_SKIP
+        if until_cycle is not None:
+            limit = min(limit, (until_cycle - pipeline.cycle) // cycles)
+        if until_retired is not None and retired:
+            # 停在剛好達到 until_retired 的那個 cycle，不能整圈跳過
+            limit = min(limit, (until_retired - pipeline.retired - 1) // retired)
+        if limit <= 0:
+            return 0
+        start = read_state(pipeline, summary.start_vars)
+        n = summary.iterations(start, limit)
+        if n <= 0:
+            return 0
+
+        write_state(pipeline, summary.state_at(start, n))
+        self._replay(pipeline, summary.steps, n)
+        if pipeline.binary_trace is not None:
+            # 每一圈各階段的指令 index 都相同，佔用紀錄直接重複
+            for _ in range(n):
+                pipeline.binary_trace.extend(summary.rows)
+        pipeline.cycle += n * cycles
+        pipeline.stall_cycles += n * stalls
+        pipeline.flush_count += n * flushes
+        pipeline.retired += n * retired
+        pipeline.counters.add(summary.counters, n)
+        self.skipped_iterations += n
+        self.skipped_cycles += n * cycles
+        return n
+
+    def _replay(self, pipeline, steps, n):
+        """重播被跳過的 cycle 的輸出，cycle 編號接續"""
+        output = pipeline.output
+        tracer = pipeline.tracer
+        if isinstance(output, NullOutput) and not tracer.cycle:
+            pipeline.outputcycle += n * len(steps)
+            return
+        cycle = pipeline.cycle
+        for _ in range(n):
+            for lines in steps:
+                header = f"Cycle {pipeline.outputcycle}"
+                pipeline.outputcycle += 1
+                cycle += 1
+                output.append(header)
+                output.extend(lines)
+                if tracer.cycle:
+                    tracer.cycle_lines(cycle, [header, *lines])
+
+
+def record_iteration(pipeline, program, next_cycle, key):
+    """在 pipeline 的副本上以符號值跑一圈，回到同一個迴圈開頭時回傳 LoopSummary
+
+    途中出現無法以仿射式表示的運算、越界，或遲遲回不到開頭時回傳 None。
+    """
+    recorder = []
+    shadow = copy.copy(pipeline)
+    # 掛在實例上的 hook（例如 StageProfiler）改綁到副本
+    for name, value in list(vars(shadow).items()):
+        if isinstance(value, MethodType) and value.__self__ is pipeline:
+            setattr(shadow, name, MethodType(value.__func__, shadow))
+    shadow.tracer = SILENT
+    shadow.output = []
+    shadow.free_latches = []
+    shadow.loop_memo = None
+    shadow.counters = pipeline.counters.copy()
+    shadow.binary_trace = [] if pipeline.binary_trace is not None else None
+    shadow.registers = [Sym.var(("r", i), value, recorder) for i, value in enumerate(pipeline.registers)]
+    shadow.memory = SymbolicMemory(pipeline.memory, recorder)
+    start_vars = [("r", i) for i in range(len(pipeline.registers))]
+    for name in LATCHES:
+        latch = getattr(pipeline, name)
+        if latch is None:
+            continue
+        latch = latch.copy()
+        for field in LATCH_VALUES:
+            value = getattr(latch, field)
+            if value is not None:
+                setattr(latch, field, Sym.var((name, field), value, recorder))
+                start_vars.append((name, field))
+        setattr(shadow, name, latch)
+
+    steps = []
+    try:
+        for _ in range(MAX_RECORD_CYCLES):
+            if not (shadow.IF_ID or shadow.ID_EX or shadow.EX_MEM or shadow.MEM_WB
+                    or shadow.simulate_pipeline_index < len(program)):
+                return None
+            loop_head = next_cycle(shadow, program)
+            steps.append(tuple(shadow.output[1:]))
+            shadow.output.clear()
+            if loop_head and control_key(shadow) == key:
+                break
+        else:
+            return None
+
+        start_vars.extend(("m", address) for address in shadow.memory.loaded)
+        transfer = {("r", i): value for i, value in enumerate(shadow.registers)}
+        transfer.update({("m", address): value for address, value in shadow.memory.cells.items()})
+        for name in LATCHES:
+            latch = getattr(shadow, name)
+            for field in LATCH_VALUES if latch is not None else ():
+                value = getattr(latch, field)
+                if value is not None:
+                    transfer[(name, field)] = value
+        deltas = (shadow.cycle - pipeline.cycle, shadow.stall_cycles - pipeline.stall_cycles,
+                  shadow.flush_count - pipeline.flush_count, shadow.retired - pipeline.retired)
+        counters = shadow.counters.difference(pipeline.counters)
+        rows = tuple(shadow.binary_trace) if shadow.binary_trace is not None else None
+        return LoopSummary(start_vars, transfer, recorder, tuple(steps), deltas, counters, rows)
+    except (TypeError, ValueError, KeyError, IndexError):
+        return None
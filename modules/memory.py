@@ -0,0 +1,100 @@
+import mmap
+from array import array
+
+DEFAULT_MEMORY_WORDS = 32
+DEFAULT_FILL = 1         # 與原本 [1] * 32 相同，每個字組初始為 1
+WORD_TYPECODE = 'i'      # 32 位元有號整數
+
+
+def to_word(value):
+    """將暫存器的值截成 32 位元有號整數後才能存進記憶體"""
+    if -0x80000000 <= value <= 0x7FFFFFFF:
+        return value
+    return ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+class SparseMemory:
+    """以分頁表實作的稀疏記憶體，只有寫過的頁面才會配置
+
+    適合很大但大多是空白的位址空間，未寫過的字組讀到 fill。
+    """
+
+    def __init__(self, size, fill=DEFAULT_FILL, page_words=1024):
+        if page_words & (page_words - 1):
+            raise ValueError("page_words must be a power of two")
+        self.size = size
+        self.fill = fill
+        self.page_words = page_words
+        self.page_shift = page_words.bit_length() - 1
+        self.page_mask = page_words - 1
+        self.pages = {}
+
+    def __len__(self):
+        return self.size
+
+    def _check(self, address):
+        if not 0 <= address < self.size:
+            raise IndexError(f"memory address out of range: {address}")
+
+    def __getitem__(self, address):
+        if isinstance(address, slice):
+            return [self[i] for i in range(*address.indices(self.size))]
+        self._check(address)
+        page = self.pages.get(address >> self.page_shift)
+        if page is None:
+            return self.fill
+        return page[address & self.page_mask]
+
+    def __setitem__(self, address, value):
+        self._check(address)
+        page = self.pages.get(address >> self.page_shift)
+        if page is None:
+            page = self.pages[address >> self.page_shift] = array(WORD_TYPECODE, [self.fill]) * self.page_words
+        page[address & self.page_mask] = value
+
+    def __iter__(self):
+        for address in range(self.size):
+            yield self[address]
+
+    def copy(self):
+        memory = SparseMemory(self.size, self.fill, self.page_words)
+        memory.pages = {number: array(page) for number, page in self.pages.items()}
+        return memory
+
+
+def create_memory(size=DEFAULT_MEMORY_WORDS, fill=DEFAULT_FILL, sparse=False, page_words=1024):
+    """建立記憶體：預設為連續的 array('i')，sparse 時使用分頁表"""
+    if sparse:
+        return SparseMemory(size, fill, page_words)
+    return array(WORD_TYPECODE, [fill]) * size
+
+
+def load_memory_image(file_path):
+    """以 mmap 載入二進位記憶體映像，不複製資料
+
+    檔案內容為連續的 32 位元有號整數（本機位元組順序）。
+    映射為 copy-on-write，模擬時的寫入不會改到原始檔案。
+    """
+    with open(file_path, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    if len(mapped) % array(WORD_TYPECODE).itemsize:
+        mapped.close()
+        raise ValueError(f"Memory image size is not a multiple of the word size: {file_path}")
+    return memoryview(mapped).cast(WORD_TYPECODE)
+
+
+def save_memory_image(memory, file_path):
+    """將記憶體內容寫成 load_memory_image 可讀的二進位檔"""
+    if not isinstance(memory, SparseMemory):
+        memory = copy_memory(memory)
+    with open(file_path, 'wb') as file:
+        file.write(array(WORD_TYPECODE, memory).tobytes())
+
+
+def copy_memory(memory):
+    """複製記憶體內容，mmap 映像會複製成 array"""
+    if isinstance(memory, SparseMemory):
+        return memory.copy()
+    if isinstance(memory, memoryview):
+        return array(WORD_TYPECODE, memory.tobytes())
+    return memory[:]
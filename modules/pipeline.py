@@ -1,399 +1,598 @@
-import re
-from modules.io_handler import load_instructions, save_output
+from modules.analysis import STALL_BRANCH, STALL_DATA, STALL_LOAD_USE, destination
+from modules.bintrace import EMPTY_ROW, FLUSH, HOLD, STALL, forward_byte
+from modules.counters import PerfCounters
+from modules.io_handler import save_output
+from modules.isa import OP_ADD, OP_SUB, OP_LW, OP_SW, OP_BEQ, decode_line
+from modules.memo import LoopMemo
+from modules.memory import DEFAULT_MEMORY_WORDS, copy_memory, create_memory, to_word
+from modules.program import as_program, load_program
+from modules.threaded import compile_stages
+from modules.trace import Tracer
+
+# 可選的微架構變化
+BRANCH_STAGES = ("EX", "ID")            # beq 在哪個階段比較並改變 PC
+LOAD_USE_POLICIES = ("stall", "forward")  # lw 後緊接著使用：stall 一個 cycle，或把 MEM 讀到的值直接轉送到 EX
+BACKENDS = ("interp", "threaded")        # EX/MEM/WB 用直譯的方法，或每條指令預先編譯好的函式
+
+class Latch:
+    """ID/EX、EX/MEM、MEM/WB 共用的 latch 紀錄
+
+    指令在 ID 時取得一個 Latch，之後各階段直接在上面填結果往下傳，
+    WB 完成後放回 pipeline 的 free list 重複使用。
+    不適用的欄位為 None，與原本 latch dict 的 .get 一致。
+    """
+    __slots__ = ("instruction", "index", "op", "opcode", "rs", "rt", "rd", "reg", "base",
+                 "offset", "control", "lines", "result", "data", "address", "taken")
+
+    # 只在管線中途會改變的欄位，checkpoint 需要保存
+    STATE_FIELDS = ("index", "rd", "result", "data", "address", "taken")
+
+    def load(self, instruction, index):
+        """以解碼後的 Instruction 填入 ID/EX"""
+        self.instruction = instruction
+        self.index = index
+        self.op = instruction.op
+        self.opcode = instruction.opcode
+        self.rs = instruction.rs
+        self.rt = instruction.rt
+        self.rd = instruction.rd
+        self.reg = instruction.reg
+        self.base = instruction.base
+        self.offset = instruction.offset
+        self.control = instruction.control
+        self.lines = instruction.lines
+        self.result = None
+        self.data = None
+        self.address = None
+        self.taken = None
+        return self
+
+    def copy(self):
+        latch = Latch()
+        for name in self.__slots__:
+            setattr(latch, name, getattr(self, name))
+        return latch
+
+    def get_state(self):
+        state = {name: getattr(self, name) for name in self.STATE_FIELDS}
+        state["text"] = self.instruction.text
+        return state
+
+    def set_state(self, state):
+        self.load(decode_line(state["text"]), state["index"])
+        for name in self.STATE_FIELDS:
+            setattr(self, name, state[name])
+        return self
+
+    def __repr__(self):
+        fields = {name: getattr(self, name) for name in ("op", "rd", "rs", "rt", "reg", "base", "offset",
+                                                          "result", "data", "address", "taken")}
+        return repr({name: value for name, value in fields.items() if value is not None})
+
 
 class Pipeline:
-    def __init__(self,input_number):
-        self.IF_ID = None
-        self.ID_EX = None
+    def __init__(self,input_number=None, tracer=None, output=None, program=None, memory=None,
+                 static_hazards=True, loop_memo=True, forwarding=True, branch_stage="EX",
+                 load_use="stall", memory_size=DEFAULT_MEMORY_WORDS, backend="interp"):
+        self.IF_ID = None   # Instruction
+        self.ID_EX = None   # 以下三個為 Latch
         self.EX_MEM = None
         self.MEM_WB = None
+        # IF/ID 中指令在程式裡的 index，空的為 -1，其他 latch 的 index 記在 Latch 上
+        self.IF_ID_index = -1
+        # WB 完成後回收的 Latch
+        self.free_latches = []
 
         self.registers = [1] * 32  # 初始化暫存器
         self.registers[0] = 0
-        self.memory = [1] * 32
+        # 預設為 memory_size 個字組的 array('i')，也可傳入 create_memory/load_memory_image 建立的記憶體
+        self.memory = memory if memory is not None else create_memory(memory_size)
+
+        # 微架構選項：forwarding 關閉時相依的指令要等前一條寫回才能執行
+        if branch_stage not in BRANCH_STAGES:
+            raise ValueError(f"Unknown branch stage: {branch_stage}")
+        if load_use not in LOAD_USE_POLICIES:
+            raise ValueError(f"Unknown load-use policy: {load_use}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+        self.forwarding = forwarding
+        self.branch_stage = branch_stage
+        self.branch_in_id = branch_stage == "ID"
+        self.load_use = load_use
+        self.backend = backend
 
         self.cycle = 0
         self.ForwardA = "00"
         self.ForwardB = "00"
 
-        self.if_taken=0
-        self.target_index=0
+        self.if_taken=0      # 這個 cycle 有 beq taken，ID 與 IF 不前進
         self.stall_counter=0
+        self.stall_cycles=0  # 累計 stall 的 cycle 數
+        self.flush_count=0   # 累計 beq taken 造成的 flush 次數
+        self.retired=0       # 完成 WB 的指令數
+        self.counters = PerfCounters()  # stall 原因、分支與 forwarding 等事件計數
+        self.binary_trace = None        # 有 append 的物件（BinaryTraceWriter）時每個 cycle 附加一列佔用紀錄
         
         self.simulate_pipeline_index=0
-        self.beq_taken_instructions = load_instructions(f"inputs/test{input_number}.txt")
+        if program is None:
+            program = load_program(f"inputs/test{input_number}.txt")
+        # 唯讀的 Program，多個 Pipeline 可以共用
+        self.program = as_program(program)
+        # 靜態相依分析，fall-through 時 stall 與 forwarding 直接查表，只適用預設的 hazard 規則
+        static_hazards = static_hazards and forwarding and load_use == "stall"
+        self.analysis = self.program.analysis if static_hazards else None
+        # 往回跳的迴圈記憶化，stage 追蹤時不使用
+        self.loop_memo = LoopMemo() if loop_memo else None
         self.outputcycle=1
-        self.output = []  # 用來記錄每個 cycle 的輸出
+        # 用來記錄每個 cycle 的輸出，可以傳入 OutputWriter 直接寫到檔案
+        self.output = output if output is not None else []
+        self.tracer = tracer if tracer is not None else Tracer()
+        # threaded 時 step 直接呼叫每條指令編譯好的函式；stage 追蹤需要各階段的除錯訊息，仍用直譯
+        self.stages = compile_stages(self.program) if backend == "threaded" and not self.tracer.stage else None
 
     def fetch(self, instruction):
         self.if_taken=0
         """模擬 IF 階段"""
         if instruction:
-            print(f"Cycle {self.cycle + 1}: Fetching instruction: {instruction}")
+            if self.tracer.stage:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Fetching instruction: {instruction}")
         return instruction
 
     def fetch_target(self, target_index):
         """重新抓取目標指令"""
-        print(f"Fetching target instruction at index {target_index}")
+        if self.tracer.stage:
+            self.tracer.write(f"Fetching target instruction at index {target_index}")
         # 模擬重新抓取邏輯 (實際指令存取需根據指令存儲結構實作)
 
 
-    def decode(self, instruction):
-        """模擬 ID 階段"""
+    def decode(self, instruction, index=-1):
+        """模擬 ID 階段，instruction 為已解碼的 Instruction，回傳填好的 Latch"""
         if not instruction:
             return None
 
-        parts = instruction.split()
-        op = parts[0]
-
-        control_signals = {
-            "RegDst": "X", "ALUSrc": "X", "Branch": "X",  "MemRead": "X",
-            "MemWrite": "X", "RegWrite": "X", "MemtoReg": "X", "ALUOp": "X"
-        }
-
-        if op == "beq":
-            rs = int(parts[1][1:].replace(",", ""))
-            rt = int(parts[2][1:].replace(",", ""))
-            offset = int(parts[3])
-            control_signals.update({"ALUSrc": "0","RegWrite": "0", "ALUOp": "01",
-                                    "MemRead": "0","MemWrite": "0","Branch": "1"})
-            
-            print(f"Cycle {self.cycle + 1}: Decoding BEQ -> rs: {rs}, rt: {rt}, offset: {offset}, Signals: {control_signals}")
-            return {"op": op, "rs": rs, "rt": rt, "offset": offset, "control": control_signals}
+        op = instruction.op
+        if self.tracer.stage:
+            signals = instruction.control._asdict()
+            if op == "beq":
+                self.tracer.write(f"Cycle {self.cycle + 1}: Decoding BEQ -> rs: {instruction.rs}, rt: {instruction.rt}, offset: {instruction.offset}, Signals: {signals}")
+            elif op in ["add", "sub"]:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Decoding {op.upper()} -> rd: {instruction.rd}, rs: {instruction.rs}, rt: {instruction.rt}, Signals: {signals}")
+            else:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Decoding {op.upper()} -> reg: {instruction.reg}, offset: {instruction.offset}, base: {instruction.base}, Signals: {signals}")
+        latch = self.free_latches.pop() if self.free_latches else Latch()
+        return latch.load(instruction, index)
+
+    def branch_operand(self, reg):
+        """ID 階段比較 beq 時的暫存器值，EX/MEM 與 MEM/WB 是這個 cycle 剛算完的結果"""
+        if self.forwarding:
+            ex_mem = self.EX_MEM
+            if ex_mem and ex_mem.opcode <= OP_SUB and ex_mem.rd == reg:
+                return ex_mem.result
+            mem_wb = self.MEM_WB
+            if mem_wb and mem_wb.rd == reg:
+                return mem_wb.data if mem_wb.opcode == OP_LW else mem_wb.result
+        return self.registers[reg]
+
+    def resolve_branch_in_id(self, latch):
+        """branch_stage 為 ID 時在解碼後比較，taken 就讓這個 cycle 的 IF 直接抓目標，不用 flush"""
+        taken = latch.taken = self.branch_operand(latch.rs) == self.branch_operand(latch.rt)
+        if taken:
+            self.counters.taken_branches += 1
+        else:
+            self.counters.not_taken_branches += 1
+        if self.tracer.stage:
+            self.tracer.write(f"Cycle {self.cycle + 1}: BEQ resolved in ID -> {'Taken' if taken else 'Not Taken'}")
+        if taken:
+            self.redirect(self.program.targets[latch.index])
+
+    def redirect(self, target):
+        """從絕對 index target 開始抓指令，跳到程式結尾時不再抓指令"""
+        if self.tracer.stage:
+            self.tracer.write(f"Fetching target instruction at index {target}:")
+        if target < len(self.program):
+           self.IF_ID_index = target
+           self.IF_ID = self.fetch(self.program[target])
+           self.simulate_pipeline_index = target + 1
+        else:
+           self.simulate_pipeline_index = target
+        self.if_taken=1
 
-        
-        elif op in ["add", "sub"]:
-            rd = int(parts[1][1:].replace(",", ""))
-            rs = int(parts[2][1:].replace(",", ""))
-            rt = int(parts[3][1:].replace(",", ""))
-            alu_op = "10" if op == "add" else "11"
-            control_signals.update({"RegDst": "1", "ALUSrc": "0", "MemtoReg": "0","RegWrite": "1", "ALUOp": alu_op,
-                                    "MemRead": "0","MemWrite": "0","Branch": "0"})
-            print(f"Cycle {self.cycle + 1}: Decoding {op.upper()} -> rd: {rd}, rs: {rs}, rt: {rt}, Signals: {control_signals}")
-            return {"op": op, "rd": rd, "rs": rs, "rt": rt, "control": control_signals}
-
-        elif op in ["lw", "sw"]:
-            match = re.match(r'\$(\d+),\s*(\d+)\(\$(\d+)\)', " ".join(parts[1:]))
-            if match:
-                reg = int(match.group(1))
-                offset = int(match.group(2))
-                base = int(match.group(3))
-                control_signals.update({
-                    "RegDst": "0" if op == "lw" else "X",
-                    "ALUSrc": "1",
-                    "MemtoReg": "1" if op == "lw" else "X",
-                    "RegWrite": "1" if op == "lw" else "0",
-                    "MemRead": "1" if op == "lw" else "0",
-                    "MemWrite": "1" if op == "sw" else "0",
-                    "Branch": "0"
-                })
-                print(f"Cycle {self.cycle + 1}: Decoding {op.upper()} -> reg: {reg}, offset: {offset}, base: {base}, Signals: {control_signals}")
-                return {"op": op, "reg": reg, "offset": offset, "base": base, "control": control_signals}
-
-        raise ValueError(f"Unsupported instruction: {instruction}")
-
-    def execute(self, decoded_instruction):
-        """模擬 EX 階段"""
-        if not decoded_instruction:
+    def execute(self, latch):
+        """模擬 EX 階段，結果填在同一個 Latch 上"""
+        if not latch:
             return None
 
-        op = decoded_instruction["op"]
-        control = decoded_instruction["control"]
-        self.detect_forwarding_signals(decoded_instruction)
+        opcode = latch.opcode
+        k = latch.index
+        mem_wb = self.MEM_WB
+        if (self.analysis and k >= 0 and not self.EX_MEM
+                and (mem_wb.index if mem_wb else -1) == k - 1):
+            # MEM/WB 是前一條指令，轉送信號已由靜態分析決定
+            self.ForwardA, self.ForwardB = self.analysis.forward[k]
+        elif not self.forwarding:
+            self.ForwardA = "00"
+            self.ForwardB = "00"
+        else:
+            self.detect_forwarding_signals(latch)
         self.if_taken=0
 
-        if op == "add":
-            rs_value = self.get_forwarded_value("A", decoded_instruction["rs"])
-            rt_value = self.get_forwarded_value("B", decoded_instruction["rt"])
-            result = rs_value + rt_value
-            print(f"Cycle {self.cycle + 1}: Executing ADD -> Result: {result}, Control Signals: {control}")
-            return {"op": op, "result": result, "rd": decoded_instruction["rd"], "control": control}
-
-        elif op == "sub":
-            rs_value = self.get_forwarded_value("A", decoded_instruction["rs"])
-            rt_value = self.get_forwarded_value("B", decoded_instruction["rt"])
-            result = rs_value - rt_value
-            print(f"Cycle {self.cycle + 1}: Executing SUB -> Result: {result}, Control Signals: {control}")
-            return {"op": op, "result": result, "rd": decoded_instruction["rd"], "control": control}
+        if opcode == OP_ADD:
+            rs_value = self.get_forwarded_value("A", latch.rs)
+            rt_value = self.get_forwarded_value("B", latch.rt)
+            latch.result = rs_value + rt_value
+            if self.tracer.stage:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Executing ADD -> Result: {latch.result}, Control Signals: {latch.control._asdict()}")
+
+        elif opcode == OP_SUB:
+            rs_value = self.get_forwarded_value("A", latch.rs)
+            rt_value = self.get_forwarded_value("B", latch.rt)
+            latch.result = rs_value - rt_value
+            if self.tracer.stage:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Executing SUB -> Result: {latch.result}, Control Signals: {latch.control._asdict()}")
         
-        elif op == "beq":
-            rs_value = self.get_forwarded_value("A", decoded_instruction["rs"])
-            rt_value = self.get_forwarded_value("B", decoded_instruction["rt"])
-            taken = rs_value == rt_value
+        elif opcode == OP_BEQ and self.branch_stage == "ID":
+            # 已在 ID 階段比較過
+            pass
+
+        elif opcode == OP_BEQ:
+            rs_value = self.get_forwarded_value("A", latch.rs)
+            rt_value = self.get_forwarded_value("B", latch.rt)
+            taken = latch.taken = rs_value == rt_value
 
             if taken:
-                print(f"Cycle {self.cycle + 1}: BEQ Taken -> Flushing pipeline and fetching target")
-                # 清空 IF/ID 寄存器 (flush pipeline)
+                self.counters.taken_branches += 1
+                if self.tracer.stage:
+                    self.tracer.write(f"Cycle {self.cycle + 1}: BEQ Taken -> Flushing pipeline and fetching target")
+                # 清空 IF/ID 寄存器 (flush pipeline)，被丟掉的指令算一個 flushed slot
+                if self.IF_ID:
+                    self.counters.flushed_slots += 1
                 self.IF_ID = None
+                self.IF_ID_index = -1
+                self.flush_count+=1
 
-                self.target_index=decoded_instruction["offset"]
-                print(self.target_index,"*****************測試用*********************")
-
-                if self.target_index!=0:
-                   print(f"Fetching target instruction at index {self.simulate_pipeline_index}:")
-                   self.IF_ID = self.fetch(self.beq_taken_instructions[self.simulate_pipeline_index+self.target_index-2])
-                   self.simulate_pipeline_index=self.simulate_pipeline_index+self.target_index-1
+                if self.tracer.stage:
+                    self.tracer.write(f"{latch.offset} *****************測試用*********************")
+                # 目標在載入時已換成絕對 index
+                self.redirect(self.program.targets[latch.index])
 
             else:
-                print(f"Cycle {self.cycle + 1}: BEQ Not Taken -> Continuing pipeline")
-                self.target_index=0
-
-            return {"op": op, "taken": taken, "control": control}
+                self.counters.not_taken_branches += 1
+                if self.tracer.stage:
+                    self.tracer.write(f"Cycle {self.cycle + 1}: BEQ Not Taken -> Continuing pipeline")
 
-        elif op in ["lw", "sw"]:
-            address = self.registers[decoded_instruction["base"]] +  (decoded_instruction["offset"]//4)
-            print(f"Cycle {self.cycle + 1}: Executing {op.upper()} -> Address: {address}, Control Signals: {control}")
-            return {"op": op, "address": address, "reg": decoded_instruction.get("reg"), "control": control}
+        else:
+            latch.address = self.registers[latch.base] +  (latch.offset//4)
+            if self.tracer.stage:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Executing {latch.op.upper()} -> Address: {latch.address}, Control Signals: {latch.control._asdict()}")
+        return latch
         
         
-    def memory_access(self, executed_result):
+    def memory_access(self, latch):
         """模擬 MEM 階段"""
-        if not executed_result:
+        if not latch:
             return None
 
-        op = executed_result["op"]
-        control = executed_result["control"]
-
-        if op == "lw":
-            data = self.memory[executed_result["address"]]
-            print(f"Cycle {self.cycle + 1}: Memory Access LW -> Data: {data}, Control Signals: {control}")
-            return {"op": op, "data": data, "rd": executed_result["reg"], "control": control}
-        
-        elif op == "sw":
-            self.memory[executed_result["address"]] = self.registers[executed_result["reg"]]
-            print(f"Cycle {self.cycle + 1}: Memory Access SW -> Memory[{executed_result['address']}] = {self.registers[executed_result['reg']]}, Control Signals: {control}")           
-            return {"op": op, "control": control}
+        opcode = latch.opcode
+        if opcode == OP_LW:
+            latch.data = self.memory[latch.address]
+            latch.rd = latch.reg
+            if self.tracer.stage:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Memory Access LW -> Data: {latch.data}, Control Signals: {latch.control._asdict()}")
         
+        elif opcode == OP_SW:
+            self.memory[latch.address] = to_word(self.registers[latch.reg])
+            if self.tracer.stage:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Memory Access SW -> Memory[{latch.address}] = {self.memory[latch.address]}, Control Signals: {latch.control._asdict()}")
         
-        elif op in ["add", "sub"]:
-        # 這些指令不需要訪問記憶體，所以直接返回計算的結果
-            print(f"Cycle {self.cycle + 1}: Memory Access {op.upper()} -> No memory access needed, Control Signals: {control}")
-            return {"op": op, "result": executed_result["result"], "rd": executed_result["rd"], "control": control}
-        
-        elif op in ["beq"]:
+        else:
         # 這些指令不需要訪問記憶體，所以直接返回計算的結果
-            print(f"Cycle {self.cycle + 1}: Memory Access {op.upper()} -> No memory access needed, Control Signals: {control}")
-            return {"op": op,"control": control}
+            if self.tracer.stage:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Memory Access {latch.op.upper()} -> No memory access needed, Control Signals: {latch.control._asdict()}")
+        return latch
         
         
-    def write_back(self, mem_result):
+    def write_back(self, latch):
         """模擬 WB 階段"""
-        if not mem_result:
+        if not latch:
             return
 
-        op = mem_result["op"]
-        control = mem_result["control"]
-        if op in ["lw", "add", "sub"]:
-            result = mem_result.get("data", mem_result.get("result"))
-            self.registers[mem_result["rd"]] = result
-            print(f"Cycle {self.cycle + 1}: Write Back -> Register[{mem_result['rd']}] = {result}, Control Signals: {control}")
+        opcode = latch.opcode
+        self.retired += 1
+        if opcode <= OP_LW:
+            result = latch.data if opcode == OP_LW else latch.result
+            self.registers[latch.rd] = result
+            if self.tracer.stage:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Write Back -> Register[{latch.rd}] = {result}, Control Signals: {latch.control._asdict()}")
         else:
-            print(f"Cycle {self.cycle + 1}: Write Back -> No Register Write, Control Signals: {control}")
+            if self.tracer.stage:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Write Back -> No Register Write, Control Signals: {latch.control._asdict()}")
         
 
     def get_forwarded_value(self, path, reg_index):
         """根據 Forward 信號獲取暫存器值"""
+        # MEM/WB 轉送要寫回的值，lw 為讀到的資料（只有 load_use 為 forward 時會發生）
         if path == "A":
             if self.ForwardA == "10":
-                return self.EX_MEM["result"]
+                self.counters.forward_ex_mem_a += 1
+                return self.EX_MEM.result
             elif self.ForwardA == "01":
-                return self.MEM_WB["result"]
+                self.counters.forward_mem_wb_a += 1
+                mem_wb = self.MEM_WB
+                return mem_wb.data if mem_wb.opcode == OP_LW else mem_wb.result
         elif path == "B":
             if self.ForwardB == "10":
-                return self.EX_MEM["result"]
+                self.counters.forward_ex_mem_b += 1
+                return self.EX_MEM.result
             elif self.ForwardB == "01":
-                return self.MEM_WB["result"]
+                self.counters.forward_mem_wb_b += 1
+                mem_wb = self.MEM_WB
+                return mem_wb.data if mem_wb.opcode == OP_LW else mem_wb.result
         return self.registers[reg_index]
 
-    def detect_forwarding_signals(self, decoded_instruction):
+    def detect_forwarding_signals(self, latch):
         """檢測 Forwarding 信號"""
         self.ForwardA = "00"
         self.ForwardB = "00"
+        ex_mem = self.EX_MEM
+        mem_wb = self.MEM_WB
 
         # EX Hazard
-        if self.EX_MEM and self.EX_MEM.get("rd") == decoded_instruction.get("rs"):
+        if ex_mem and ex_mem.rd == latch.rs:
             self.ForwardA = "10"
-        if self.EX_MEM and self.EX_MEM.get("rd") == decoded_instruction.get("rt"):
+        if ex_mem and ex_mem.rd == latch.rt:
             self.ForwardB = "10"
 
         # MEM Hazard
-        if self.MEM_WB and self.MEM_WB.get("rd") == decoded_instruction.get("rs") and self.ForwardA != "10":
+        if mem_wb and mem_wb.rd == latch.rs and self.ForwardA != "10":
             self.ForwardA = "01"
-        if self.MEM_WB and self.MEM_WB.get("rd") == decoded_instruction.get("rt") and self.ForwardB != "10":
+        if mem_wb and mem_wb.rd == latch.rt and self.ForwardB != "10":
             self.ForwardB = "01"
 
         # SW Forwarding
-        if decoded_instruction["op"] == "sw":
-            if self.EX_MEM and self.EX_MEM.get("rd") == decoded_instruction.get("reg"):
+        if latch.opcode == OP_SW:
+            if ex_mem and ex_mem.rd == latch.reg:
                 self.ForwardB = "10"
-            if self.MEM_WB and self.MEM_WB.get("rd") == decoded_instruction.get("reg") and self.ForwardB != "10":
+            if mem_wb and mem_wb.rd == latch.reg and self.ForwardB != "10":
                 self.ForwardB = "01"
 
     def detect_hazard_lw_stall(self):
-        """檢測lw的datahazard"""
+        """檢測lw的datahazard，需要 stall 時回傳原因（STALL_*），否則為 0"""
+        j = self.IF_ID_index
+        id_ex = self.ID_EX
+        ex_mem = self.EX_MEM
+        if (self.analysis and j >= 0 and not self.tracer.stage
+                and (id_ex.index if id_ex else -1) == j - 1
+                and (ex_mem.index if ex_mem else -1) == j - 2):
+            # fall-through 且中間沒有 bubble，直接查靜態分析的結果
+            return self.analysis.stall[j]
+
         """前一個是lw"""
-        if self.ID_EX and self.ID_EX["op"] == "lw":
-           rd = self.ID_EX["reg"] 
+        if id_ex and id_ex.opcode == OP_LW:
+           rd = id_ex.reg 
            if self.IF_ID:
-              instr = self.IF_ID.split()
-              if instr[0] in ["add", "sub"]:
-                 rs = int(instr[2].replace(",", "").replace("$", ""))
-                 rt = int(instr[3].replace(",", "").replace("$", ""))
-                 if rd in [rs, rt]:
-                    print(f"Data Hazard detected: Stalling for lw $r{rd}")
-                    return True
-                 
-              elif instr[0] in ["beq"]:
-                 rs = int(instr[1].replace(",", "").replace("$", ""))
-                 rt = int(instr[2].replace(",", "").replace("$", ""))
-                 if rd in [rs, rt]:
-                    print(f"Data Hazard detected: Stalling for lw $r{rd}")
-                    return True 
+              instr = self.IF_ID
+              # load_use 為 forward 時 add/sub 直接拿 MEM/WB 的資料，不需要 stall
+              if instr.op == "beq" or (instr.op in ["add", "sub"] and self.load_use == "stall"):
+                 if rd == instr.rs or rd == instr.rt:
+                    if self.tracer.stage:
+                        self.tracer.write(f"Data Hazard detected: Stalling for lw $r{rd}")
+                    return STALL_LOAD_USE
                  
         #beq前兩個是lw
-        elif self.EX_MEM and self.EX_MEM["op"] == "lw":
-           rd = self.EX_MEM["reg"] 
-           if self.IF_ID:
-              instr = self.IF_ID.split()     
-              if instr[0] in ["beq"]:
-                 rs = int(instr[1].replace(",", "").replace("$", ""))
-                 rt = int(instr[2].replace(",", "").replace("$", ""))
-                 if rd in [rs, rt]:
-                    print(f"Data Hazard detected: Stalling for lw $r{rd}")
-                    return True   
-
-        #beq前一個是add       
-        elif self.ID_EX and self.ID_EX["op"] == "add":
-           rd = self.ID_EX["rd"] 
+        elif ex_mem and ex_mem.opcode == OP_LW:
+           rd = ex_mem.reg 
            if self.IF_ID:
-              instr = self.IF_ID.split()      
-              if instr[0] in ["beq"]:
-                 rs = int(instr[1].replace(",", "").replace("$", ""))
-                 rt = int(instr[2].replace(",", "").replace("$", ""))
-                 if rd in [rs, rt]:
-                    print(f"Data Hazard detected: Stalling for add $r{rd}")
-                    return True
-
-        #beq前一個是sub        
-        elif self.ID_EX and self.ID_EX["op"] == "sub":
-           rd = self.ID_EX["rd"] 
+              instr = self.IF_ID
+              if instr.op == "beq":
+                 if rd == instr.rs or rd == instr.rt:
+                    if self.tracer.stage:
+                        self.tracer.write(f"Data Hazard detected: Stalling for lw $r{rd}")
+                    return STALL_BRANCH
+
+        #beq前一個是add/sub
+        elif id_ex and id_ex.opcode <= OP_SUB:
+           rd = id_ex.rd 
            if self.IF_ID:
-              instr = self.IF_ID.split()      
-              if instr[0] in ["beq"]:
-                 rs = int(instr[1].replace(",", "").replace("$", ""))
-                 rt = int(instr[2].replace(",", "").replace("$", ""))
-                 if rd in [rs, rt]:
-                    print(f"Data Hazard detected: Stalling for sub $r{rd}")
-                    return True  
+              instr = self.IF_ID
+              if instr.op == "beq":
+                 if rd == instr.rs or rd == instr.rt:
+                    if self.tracer.stage:
+                        self.tracer.write(f"Data Hazard detected: Stalling for {id_ex.op} $r{rd}")
+                    return STALL_BRANCH
                  
-        return False
-
-    def step(self, instruction):
-        """模擬一步 Pipeline，處理數據冒險和停滯"""
-     
-        self.output.append(f"Cycle {self.outputcycle}")
+        if not self.forwarding:
+            return self.detect_hazard_no_forwarding()
+        return 0
+
+    def detect_hazard_no_forwarding(self):
+        """沒有 forwarding 時，來源暫存器還沒寫回就 stall
+
+        WB 在同一個 cycle 中先於 EX，所以在 EX 讀值的指令只需等 ID/EX 的指令；
+        在 ID 比較的 beq 還要等 EX/MEM 的指令。sw 要存的值在 MEM 才讀，不受影響。
+        """
+        instr = self.IF_ID
+        if not instr:
+            return 0
+        if instr.opcode == OP_LW or instr.opcode == OP_SW:
+            sources = (instr.base,)
+        else:
+            sources = (instr.rs, instr.rt)
+        producers = [self.ID_EX]
+        if instr.opcode == OP_BEQ and self.branch_stage == "ID":
+            producers.append(self.EX_MEM)
+        for producer in producers:
+            rd = destination(producer)
+            if rd is not None and rd in sources:
+                if self.tracer.stage:
+                    self.tracer.write(f"Data Hazard detected: Stalling for {producer.op} $r{rd} (no forwarding)")
+                return STALL_DATA
+        return 0
+
+    def step(self, instruction, index=-1):
+        """模擬一步 Pipeline，處理數據冒險和停滯，index 為 instruction 在程式中的位置"""
+        lines = [f"Cycle {self.outputcycle}"]  # 這個 cycle 的輸出
         self.outputcycle += 1  
 
+        binary = self.binary_trace
         if not (self.IF_ID or self.ID_EX or self.EX_MEM or self.MEM_WB or instruction):
+           self.output.extend(lines)
+           if binary is not None:
+               binary.append(EMPTY_ROW)
            return False
         # 檢測Forwarding
     # 插入stall
 
-        if self.detect_hazard_lw_stall():
-            if self.MEM_WB:
-               self.write_back(self.MEM_WB)
-               self.output.append(f"{self.MEM_WB['op']}: WB RegWrite:{self.MEM_WB['control']['RegWrite']} MemtoReg:{self.MEM_WB['control']['MemtoReg']}")
-               self.MEM_WB = None
+        stall = self.detect_hazard_lw_stall()
+        if binary is not None:
+            # WB、MEM、EX 處理的是這個 cycle 開始時 latch 裡的指令
+            row = [self.MEM_WB.index if self.MEM_WB else -1, self.EX_MEM.index if self.EX_MEM else -1,
+                   self.ID_EX.index if self.ID_EX else -1, -1, -1]
+            flushes = self.flush_count
 
-            if self.EX_MEM:
+        # WB、MEM、EX 三個階段不論是否 stall 都照常前進，latch 直接往下傳
+        stages = self.stages
+        if self.MEM_WB:
+           if stages is None:
+               self.write_back(self.MEM_WB)
+           else:
+               stages[self.MEM_WB.index][2](self, self.MEM_WB)
+           lines.append(self.MEM_WB.lines.write_back)
+           self.free_latches.append(self.MEM_WB)
+           self.MEM_WB = None
+        if self.EX_MEM:
+           if stages is None:
                self.MEM_WB = self.memory_access(self.EX_MEM)
-               self.output.append(f"{self.EX_MEM['op']}: MEM Branch:{self.EX_MEM['control']['Branch']} MemRead:{self.EX_MEM['control']['MemRead']} MemWrite:{self.EX_MEM['control']['MemWrite']} RegWrite:{self.EX_MEM['control']['RegWrite']} MemtoReg:{self.EX_MEM['control']['MemtoReg']}")
-               self.EX_MEM = None
-
-            if self.ID_EX:
+           else:
+               self.MEM_WB = stages[self.EX_MEM.index][1](self, self.EX_MEM)
+           lines.append(self.MEM_WB.lines.memory)
+           self.EX_MEM = None
+        if self.ID_EX:
+           if stages is None:
                self.EX_MEM = self.execute(self.ID_EX)
-               self.output.append(f"{self.ID_EX['op']}: EX RegDst:{self.ID_EX['control']['RegDst']} ALUSrc:{self.ID_EX['control']['ALUSrc']} Branch:{self.ID_EX['control']['Branch']} MemRead:{self.ID_EX['control']['MemRead']} MemWrite:{self.ID_EX['control']['MemWrite']} RegWrite:{self.ID_EX['control']['RegWrite']} MemtoReg:{self.ID_EX['control']['MemtoReg']}")
-               self.ID_EX = None
-
+           else:
+               self.EX_MEM = stages[self.ID_EX.index][0](self, self.ID_EX)
+           lines.append(self.EX_MEM.lines.execute)
+           self.ID_EX = None
+
+        if binary is not None:
+            row[3] = self.IF_ID_index if self.IF_ID else -1
+            # stall 時 ID 照常印出解碼，不算 hold
+            hold = self.if_taken and not stall
+        if stall:
             if self.IF_ID:
-               self.output.append(f"{self.IF_ID.split()[0]}: ID ")
+               lines.append(self.IF_ID.lines.decode)
                self.stall_counter+=1
 
-            self.ID_EX = None
-            print(f"Cycle {self.cycle + 1}: Stalling pipeline")
+            self.stall_cycles+=1
+            counters = self.counters
+            if stall == STALL_LOAD_USE:
+                counters.load_use_stalls += 1
+            elif stall == STALL_BRANCH:
+                counters.branch_stalls += 1
+            else:
+                counters.data_stalls += 1
+            if self.tracer.stage:
+                self.tracer.write(f"Cycle {self.cycle + 1}: Stalling pipeline")
 
         else: 
-            if self.MEM_WB:
-               self.write_back(self.MEM_WB)
-               self.output.append(f"{self.MEM_WB['op']}: WB RegWrite:{self.MEM_WB['control']['RegWrite']} MemtoReg:{self.MEM_WB['control']['MemtoReg']}")
-               self.MEM_WB = None
-            if self.EX_MEM:
-               self.MEM_WB = self.memory_access(self.EX_MEM)
-               self.output.append(f"{self.EX_MEM['op']}: MEM Branch:{self.EX_MEM['control']['Branch']} MemRead:{self.EX_MEM['control']['MemRead']} MemWrite:{self.EX_MEM['control']['MemWrite']} RegWrite:{self.EX_MEM['control']['RegWrite']} MemtoReg:{self.EX_MEM['control']['MemtoReg']}")
-               self.EX_MEM = None
-            if self.ID_EX:
-               self.EX_MEM = self.execute(self.ID_EX)
-               self.output.append(f"{self.ID_EX['op']}: EX RegDst:{self.ID_EX['control']['RegDst']} ALUSrc:{self.ID_EX['control']['ALUSrc']} Branch:{self.ID_EX['control']['Branch']} MemRead:{self.ID_EX['control']['MemRead']} MemWrite:{self.ID_EX['control']['MemWrite']} RegWrite:{self.ID_EX['control']['RegWrite']} MemtoReg:{self.ID_EX['control']['MemtoReg']}")
-               self.ID_EX = None
-
             if self.IF_ID:
-               if self.target_index!=0:
-                   self.output.append(f"{self.IF_ID.split()[0]}: IF ")
+               if self.if_taken:
+                   lines.append(self.IF_ID.lines.hold)
                else:
-                   self.ID_EX = self.decode(self.IF_ID)
-                   self.output.append(f"{self.IF_ID.split()[0]}: ID ")
+                   self.ID_EX = self.decode(self.IF_ID, self.IF_ID_index)
+                   lines.append(self.IF_ID.lines.decode)
                    self.IF_ID = None
+                   self.IF_ID_index = -1
                    self.stall_counter=0
+                   if self.branch_stage == "ID" and self.ID_EX.opcode == OP_BEQ:
+                       self.resolve_branch_in_id(self.ID_EX)
 
         # 如果檢測data hazard，Fetch 暫停，不更新 IF/ID
-        if instruction and self.target_index==0:
+        if instruction and not self.if_taken:
             if self.stall_counter>0:
-               self.output.append(f"{instruction.split()[0]}: IF")
+               lines.append(instruction.lines.fetch)
             else:
                self.IF_ID = self.fetch(instruction)
-               self.output.append(f"{instruction.split()[0]}: IF")
+               self.IF_ID_index = index
+               lines.append(instruction.lines.fetch)
 
-        if instruction and self.target_index!=0:
-           self.target_index=0
+        if binary is not None:
+            row[4] = index if instruction and not self.if_taken else -1
+            flags = (STALL if stall else 0) | (FLUSH if self.flush_count != flushes else 0) | (HOLD if hold else 0)
+            binary.append((*row, flags, forward_byte(self.ForwardA, self.ForwardB)))
+        self.if_taken=0
         
         # 更新 Cycle
         self.cycle += 1  
-        print(f"Cycle {self.cycle}")
-        for line in self.output:
-            print(f" {line}")
-        print()
-        self.print_pipeline_state()
+        self.output.extend(lines)
+        if self.tracer.cycle:
+            # 只輸出這個 cycle 的紀錄，不再重印整個 output
+            self.tracer.cycle_lines(self.cycle, lines)
+        if self.tracer.stage:
+            self.print_pipeline_state()
         return self.output
 
     def print_pipeline_state(self):
         """打印每個 Cycle 中的 Pipeline 狀態，包括控制信號"""
-        print(f"Cycle {self.cycle}:")
-        print(f"  IF/ID: {self.IF_ID}")
+        write = self.tracer.write
+        write(f"Cycle {self.cycle}:")
+        write(f"  IF/ID: {self.IF_ID}")
         if self.ID_EX:
-            print(f"  ID/EX: {self.ID_EX} | Signals: RegDst={self.ID_EX['control']['RegDst']}, ALUSrc={self.ID_EX['control']['ALUSrc']}, Branch={self.ID_EX['control']['Branch']}, MemRead={self.ID_EX['control']['MemRead']}, MemWrite={self.ID_EX['control']['MemWrite']}, RegWrite={self.ID_EX['control']['RegWrite']}, MemToReg={self.ID_EX['control']['MemtoReg']}")
+            control = self.ID_EX.control
+            write(f"  ID/EX: {self.ID_EX} | Signals: RegDst={control.RegDst}, ALUSrc={control.ALUSrc}, Branch={control.Branch}, MemRead={control.MemRead}, MemWrite={control.MemWrite}, RegWrite={control.RegWrite}, MemToReg={control.MemtoReg}")
         else:
-            print(f"  ID/EX: {self.ID_EX}")
+            write(f"  ID/EX: {self.ID_EX}")
         if self.EX_MEM:
-            print(f"  EX/MEM: {self.EX_MEM} | Signals: ALUResult=X, Zero=X, Branch={self.EX_MEM['control']['Branch']}, MemRead={self.EX_MEM['control']['MemRead']}, MemWrite={self.EX_MEM['control']['MemWrite']}")
+            control = self.EX_MEM.control
+            write(f"  EX/MEM: {self.EX_MEM} | Signals: ALUResult=X, Zero=X, Branch={control.Branch}, MemRead={control.MemRead}, MemWrite={control.MemWrite}")
         else:
-            print(f"  EX/MEM: {self.EX_MEM}")
+            write(f"  EX/MEM: {self.EX_MEM}")
         if self.MEM_WB:
-            print(f"  MEM/WB: {self.MEM_WB} | Signals: RegWrite={self.MEM_WB['control']['RegWrite']}, MemToReg={self.MEM_WB['control']['MemtoReg']}")
+            control = self.MEM_WB.control
+            write(f"  MEM/WB: {self.MEM_WB} | Signals: RegWrite={control.RegWrite}, MemToReg={control.MemtoReg}")
         else:
-            print(f"  MEM/WB: {self.MEM_WB}")
-
-        if self.ID_EX and self.ID_EX['control']['MemRead'] == '1' and self.ID_EX.get('reg'):
-            print("  Pipeline Stalled: Data Hazard Detected")
-        elif self.ID_EX and self.ID_EX['op'] == 'beq' and not self.EX_MEM:
-            print("  Pipeline Flushed: Control Hazard Detected")
-        print()
+            write(f"  MEM/WB: {self.MEM_WB}")
+
+        if self.ID_EX and self.ID_EX.control.MemRead == '1' and self.ID_EX.reg:
+            write("  Pipeline Stalled: Data Hazard Detected")
+        elif self.ID_EX and self.ID_EX.opcode == OP_BEQ and not self.EX_MEM:
+            write("  Pipeline Flushed: Control Hazard Detected")
+        write("")
+
+    # checkpoint 需要保存的純量狀態
+    STATE_FIELDS = ("cycle", "outputcycle", "ForwardA", "ForwardB", "if_taken",
+                    "stall_counter", "stall_cycles", "flush_count", "retired",
+                    "simulate_pipeline_index", "IF_ID_index")
+
+    def get_state(self):
+        """回傳可序列化的完整管線狀態，指令只記文字，Latch 只記會變動的欄位"""
+        state = {name: getattr(self, name) for name in self.STATE_FIELDS}
+        state["IF_ID"] = self.IF_ID.text if self.IF_ID else None
+        for name in ("ID_EX", "EX_MEM", "MEM_WB"):
+            latch = getattr(self, name)
+            state[name] = latch.get_state() if latch else None
+        state["registers"] = list(self.registers)
+        state["memory"] = copy_memory(self.memory)
+        state["counters"] = self.counters.as_dict()
+        return state
+
+    def set_state(self, state):
+        """從 get_state 的結果還原管線狀態"""
+        for name in self.STATE_FIELDS:
+            setattr(self, name, state[name])
+        self.IF_ID = decode_line(state["IF_ID"]) if state["IF_ID"] else None
+        for name in ("ID_EX", "EX_MEM", "MEM_WB"):
+            latch = state[name]
+            setattr(self, name, Latch().set_state(latch) if latch else None)
+        self.registers = list(state["registers"])
+        self.memory = copy_memory(state["memory"])
+        self.counters = PerfCounters(**state["counters"])
 
     def print_final_state(self):
         """打印最終狀態"""
-        print("\nFinal Register Values:")
-        for i in range(32):
-            print(f"$ {i} = {self.registers[i]} ", end="")
-        print("\n\nFinal Memory Values:")
-        for i in range(32):
-            print(f"M[{i}] = {self.memory[i]} ", end="")
-        print(f"\n\nTotal Cycles: {self.cycle}")
+        write = self.tracer.write
+        write("\nFinal Register Values:")
+        write("".join(f"$ {i} = {self.registers[i]} " for i in range(32)))
+        write("\nFinal Memory Values:")
+        write("".join(f"M[{i}] = {self.memory[i]} " for i in range(min(32, len(self.memory)))))
+        write(f"\nTotal Cycles: {self.cycle}")
@@ -0,0 +1,109 @@
+import time
+from collections import Counter, defaultdict
+from types import MethodType
+
+# 可以掛 hook 的 Pipeline 方法
+STAGES = ("fetch", "decode", "execute", "memory_access", "write_back",
+          "detect_hazard_lw_stall", "detect_forwarding_signals", "get_forwarded_value", "step")
+
+
+def _opcode(pipeline, name, args):
+    """這次呼叫處理的指令種類，沒有指令時為 "-" """
+    if name == "detect_hazard_lw_stall":
+        instruction = pipeline.IF_ID
+    elif name == "get_forwarded_value":
+        instruction = pipeline.ID_EX
+    else:
+        instruction = args[0] if args else None
+    return instruction.op if instruction else "-"
+
+
+class StageProfiler:
+    """量測模擬器本身各階段花的時間（不是被模擬的機器）
+
+    attach 時才在 pipeline 實例上蓋一層同名方法，沒有 attach 的 pipeline 完全不受影響。
+    每次呼叫記錄次數、總時間與自身時間（扣掉巢狀呼叫的階段），依階段與指令種類分開，
+    另外依階段記 log2(ns) 的時間分布。
+    """
+
+    def __init__(self, stages=STAGES, clock=time.perf_counter_ns):
+        self.stages = stages
+        self.clock = clock
+        self.calls = Counter()        # (階段, op) -> 次數
+        self.total_ns = Counter()     # (階段, op) -> 總時間
+        self.self_ns = Counter()      # (階段, op) -> 扣掉巢狀階段的時間
+        self.histograms = defaultdict(Counter)  # 階段 -> {log2(ns): 次數}
+        self.stacks = Counter()       # "step:add;execute:add" -> 自身時間
+        self._frames = []
+        self._children = []
+
+    def attach(self, pipeline):
+        for name in self.stages:
+            setattr(pipeline, name, MethodType(self._hook(name, getattr(type(pipeline), name)), pipeline))
+        return pipeline
+
+    def detach(self, pipeline):
+        for name in self.stages:
+            pipeline.__dict__.pop(name, None)
+        return pipeline
+
+    def _hook(self, name, method):
+        frames = self._frames
+        children = self._children
+        clock = self.clock
+
+        def hooked(pipeline, *args):
+            op = _opcode(pipeline, name, args)
+            frames.append(f"{name}:{op}")
+            children.append(0)
+            start = clock()
+            try:
+                return method(pipeline, *args)
+            finally:
+                elapsed = clock() - start
+                self._record(name, op, elapsed, elapsed - children.pop())
+                if children:
+                    children[-1] += elapsed
+                frames.pop()
+
+        return hooked
+
+    def _record(self, name, op, elapsed, own):
+        key = (name, op)
+        self.calls[key] += 1
+        self.total_ns[key] += elapsed
+        self.self_ns[key] += own
+        self.histograms[name][max(elapsed, 1).bit_length() - 1] += 1
+        self.stacks[";".join(self._frames)] += own
+
+    def stage_seconds(self):
+        """各階段的總時間（秒），含巢狀呼叫"""
+        seconds = dict.fromkeys(self.stages, 0.0)
+        for (name, _), elapsed in self.total_ns.items():
+            seconds[name] += elapsed / 1e9
+        return seconds
+
+    def collapsed(self):
+        """flame graph 工具（flamegraph.pl、speedscope）可讀的 collapsed stack，數值為自身的 ns"""
+        return "\n".join(f"{stack} {own}" for stack, own in sorted(self.stacks.items()) if own > 0)
+
+    def write_collapsed(self, file_path):
+        with open(file_path, 'w') as file:
+            file.write(self.collapsed() + "\n")
+
+
+def format_profile(profiler):
+    """各階段與指令種類的次數與時間，以及各階段的時間分布"""
+    lines = [f"{'stage':<26} {'op':<4} {'calls':>9} {'total ms':>10} {'self ms':>10} {'mean ns':>9}"]
+    for (name, op), calls in sorted(profiler.calls.items(), key=lambda item: -profiler.self_ns[item[0]]):
+        total = profiler.total_ns[(name, op)]
+        lines.append(f"{name:<26} {op:<4} {calls:>9} {total / 1e6:>10.2f} "
+                     f"{profiler.self_ns[(name, op)] / 1e6:>10.2f} {total / calls:>9.0f}")
+    for name in profiler.stages:
+        histogram = profiler.histograms.get(name)
+        if not histogram:
+            continue
+        lines.append(f"{name} time histogram:")
+        for bucket in sorted(histogram):
+            lines.append(f"  {1 << bucket:>10} ns+  {histogram[bucket]}")
+    return "\n".join(lines)
@@ -0,0 +1,166 @@
+import hashlib
+import marshal
+import os
+from array import array
+from functools import cached_property
+
+from modules.analysis import ProgramAnalysis
+from modules.io_handler import load_instructions
+from modules.isa import OP_BEQ, Instruction, compile_program
+
+# 編譯後的映像存在原始檔旁邊，例如 inputs/test3.txt.prog
+IMAGE_SUFFIX = ".prog"
+IMAGE_VERSION = 1
+
+
+def program_digest(instructions):
+    """程式內容的雜湊，用來確認 checkpoint 與程式相符"""
+    text = "\n".join(instruction.text if instruction else "" for instruction in instructions)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def resolve_targets(instructions):
+    """beq 的目標換成絕對 index（i + 1 + offset），其他指令為 None"""
+    targets = []
+    for i, instruction in enumerate(instructions):
+        if instruction is not None and instruction.opcode == OP_BEQ:
+            target = i + 1 + instruction.offset
+            if target < 0:
+                raise ValueError(f"Branch target before start of program at line {i + 1}: {instruction.text}")
+            # 跳到程式結尾之後一律視為結束
+            targets.append(min(target, len(instructions)))
+        else:
+            targets.append(None)
+    return tuple(targets)
+
+
+class Program:
+    """解碼完成、branch 目標已換成絕對 index 的程式
+
+    載入後就不再修改，同一個行程中的多個 Pipeline 直接共用同一個物件。
+    靜態分析與雜湊只在第一次用到時計算一次。
+    """
+
+    def __init__(self, instructions, source=None):
+        self.instructions = tuple(instructions)
+        self.targets = resolve_targets(self.instructions)
+        self.source = source
+
+    @classmethod
+    def from_lines(cls, lines, source=None):
+        return cls(compile_program(lines), source)
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def __getitem__(self, index):
+        return self.instructions[index]
+
+    def __iter__(self):
+        return iter(self.instructions)
+
+    def lines(self):
+        """原始的指令文字，空行為空字串"""
+        return [instruction.text if instruction else "" for instruction in self.instructions]
+
+    @cached_property
+    def digest(self):
+        return program_digest(self.instructions)
+
+    @cached_property
+    def analysis(self):
+        return ProgramAnalysis(self.instructions)
+
+
+def as_program(program):
+    """Program 直接回傳，指令文字或 Instruction 的 list 則解碼成 Program"""
+    if isinstance(program, Program):
+        return program
+    return Program.from_lines(program)
+
+
+def image_path(file_path):
+    return file_path + IMAGE_SUFFIX
+
+
+def _source_key(file_path):
+    stat = os.stat(file_path)
+    with open(file_path, 'rb') as file:
+        digest = hashlib.sha1(file.read()).hexdigest()
+    return stat.st_mtime_ns, stat.st_size, digest
+
+
+def _encode_image(program, key):
+    """相同的指令只存一次，每個位置記它在表中的編號（空行為 -1）"""
+    table = {}
+    entries = []
+    order = array('i')
+    for instruction in program.instructions:
+        if instruction is None:
+            order.append(-1)
+            continue
+        number = table.get(instruction.text)
+        if number is None:
+            number = table[instruction.text] = len(entries)
+            entries.append((instruction.text, instruction.op, instruction.rs, instruction.rt,
+                            instruction.rd, instruction.reg, instruction.base, instruction.offset))
+        order.append(number)
+    return marshal.dumps((IMAGE_VERSION, key, tuple(entries), order.tobytes()))
+
+
+def _decode_image(data):
+    version, key, entries, order_bytes = marshal.loads(data)
+    if version != IMAGE_VERSION:
+        raise ValueError(f"Unsupported program image version: {version}")
+    decoded = [Instruction(*entry) for entry in entries]
+    order = array('i')
+    order.frombytes(order_bytes)
+    return key, [decoded[number] if number >= 0 else None for number in order]
+
+
+def _read_image(path):
+    """讀取編譯映像，不存在或格式不符時回傳 None"""
+    try:
+        with open(path, 'rb') as file:
+            return _decode_image(file.read())
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+
+
+def _write_image(path, program, key):
+    """寫出編譯映像，目錄不可寫時直接略過"""
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as file:
+            file.write(_encode_image(program, key))
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def load_program(file_path, cache=True):
+    """讀取程式檔，cache 為 True 時使用旁邊的編譯映像
+
+    映像記錄原始檔的 mtime、大小與 SHA-1：mtime 與大小相同直接使用；
+    mtime 變了但內容相同時沿用並更新映像；否則重新解析並覆寫映像。
+    """
+    if not cache:
+        return Program.from_lines(load_instructions(file_path), file_path)
+
+    path = image_path(file_path)
+    stat = os.stat(file_path)
+    image = _read_image(path)
+    key = None
+    if image is not None:
+        (mtime, size, digest), instructions = image
+        if (mtime, size) == (stat.st_mtime_ns, stat.st_size):
+            return Program(instructions, file_path)
+        key = _source_key(file_path)
+        if key[2] == digest:
+            program = Program(instructions, file_path)
+            _write_image(path, program, key)
+            return program
+
+    program = Program.from_lines(load_instructions(file_path), file_path)
+    _write_image(path, program, key or _source_key(file_path))
+    return program
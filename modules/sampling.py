@@ -0,0 +1,68 @@
+import math
+from statistics import NormalDist, mean, stdev
+
+from modules.functional import run_functional
+from modules.io_handler import NullOutput
+from modules.memory import copy_memory
+from modules.pipeline import Pipeline
+from modules.program import as_program
+from modules.simulator import advance
+from modules.trace import SILENT
+
+def _measure_window(state, program, pc, warmup, window):
+    """從功能模式的狀態複製一份，跑一段詳細管線模擬並回傳該段的 CPI"""
+    pipeline = Pipeline(tracer=SILENT, output=NullOutput(), program=program)
+    pipeline.registers = list(state.registers)
+    pipeline.memory = copy_memory(state.memory)
+    pipeline.simulate_pipeline_index = pc
+
+    # 先跑 warmup 條指令讓管線填滿，再量測 window 條指令用掉的 cycle
+    advance(pipeline, program, until_retired=warmup)
+    start_cycle, start_retired = pipeline.cycle, pipeline.retired
+    advance(pipeline, program, until_retired=warmup + window)
+    retired = pipeline.retired - start_retired
+    if retired == 0:
+        return None
+    return (pipeline.cycle - start_cycle) / retired
+
+def sample_cpi(program, interval=10000, window=1000, warmup=100, confidence=0.95,
+               max_instructions=None, memory=None):
+    """抽樣模擬：每 interval 條指令跑一段詳細模擬，其餘以功能模式快轉
+
+    回傳 CPI 估計值、信賴區間半寬與推估的總 cycle 數。
+    """
+    if window <= 0 or interval < window:
+        raise ValueError("interval must be at least as large as window, and window must be positive")
+    program = as_program(program)
+    state = Pipeline(tracer=SILENT, output=NullOutput(), program=program, memory=memory)
+    pc = 0
+    total = 0
+    samples = []
+
+    while pc < len(program) and (max_instructions is None or total < max_instructions):
+        cpi = _measure_window(state, program, pc, warmup, window)
+        if cpi is not None:
+            samples.append(cpi)
+        pc, count = run_functional(state, program, pc, interval)
+        total += count
+        if count == 0:
+            break
+
+    result = {"instructions": total, "samples": len(samples), "cpi": None,
+              "cpi_error": None, "confidence": confidence, "estimated_cycles": None}
+    if samples:
+        cpi = mean(samples)
+        error = math.inf
+        if len(samples) > 1:
+            z = NormalDist().inv_cdf((1 + confidence) / 2)
+            error = z * stdev(samples) / math.sqrt(len(samples))
+        result.update(cpi=cpi, cpi_error=error, estimated_cycles=round(cpi * total))
+    return result
+
+def format_sample(result):
+    """將 sample_cpi 的結果排成文字"""
+    if result["cpi"] is None:
+        return f"Instructions: {result['instructions']}  (no samples)"
+    return (f"Instructions: {result['instructions']}  Samples: {result['samples']}\n"
+            f"CPI: {result['cpi']:.4f} ± {result['cpi_error']:.4f} ({result['confidence']:.0%} confidence)\n"
+            f"Estimated Cycles: {result['estimated_cycles']}")
@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from modules.counters import counters_report
+from modules.io_handler import NullOutput
+from modules.pipeline import Pipeline
+from modules.program import Program, load_program
+from modules.simulator import advance, run_pipeline
+from modules.sweep import DEFAULTS, MAX_CYCLES
+from modules.trace import SILENT
+
+# config 可以設定的 Pipeline 參數
+CONFIG_OPTIONS = set(DEFAULTS) | {"loop_memo", "backend"}
+# outputs 可以要求的結果
+OUTPUTS = ("summary", "counters", "registers", "memory", "trace")
+DEFAULT_OUTPUTS = ("summary",)
+# 每個 worker 快取的程式數
+PROGRAM_CACHE_SIZE = 128
+# 請求可以要求的記憶體上限（字組數），太大的配置可能讓 worker 被 OOM killer 砍掉
+MAX_MEMORY_WORDS = 1 << 24
+
+# worker 行程中的程式快取，key 為 (路徑, mtime, 大小) 或原始碼的 SHA-1
+_programs = OrderedDict()
+
+
+def _cached(key, build):
+    program = _programs.get(key)
+    if program is None:
+        program = _programs[key] = build()
+        if len(_programs) > PROGRAM_CACHE_SIZE:
+            _programs.popitem(last=False)
+    else:
+        _programs.move_to_end(key)
+    return program
+
+
+def request_program(request):
+    """取得請求中的程式：program 為檔案路徑，source 為指令文字（字串或各行的 list）"""
+    if "source" in request:
+        source = request["source"]
+        lines = source.split("\n") if isinstance(source, str) else list(source)
+        key = hashlib.sha1("\n".join(lines).encode()).hexdigest()
+        return _cached(key, lambda: Program.from_lines([line.strip() for line in lines]))
+    if "program" in request:
+        path = request["program"]
+        stat = os.stat(path)
+        return _cached((path, stat.st_mtime_ns, stat.st_size), lambda: load_program(path))
+    raise ValueError("request needs 'program' or 'source'")
+
+
+def run_job(request, max_cycles=MAX_CYCLES, max_memory=MAX_MEMORY_WORDS):
+    """在 worker 中執行一個請求，回傳要送回的 dict
+
+    請求的 max_cycles 可以把上限調低，但不超過服務的 max_cycles；沒跑完就是錯誤。
+    config 的 memory_size 超過服務的 max_memory 時直接拒絕，不做配置。
+    """
+    limit = request.get("max_cycles", max_cycles)
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit <= 0:
+        raise ValueError("max_cycles must be a positive integer")
+    limit = min(limit, max_cycles)
+    config = request.get("config") or {}
+    unknown = set(config) - CONFIG_OPTIONS
+    if unknown:
+        raise ValueError(f"Unknown config: {', '.join(sorted(unknown))}")
+    memory_size = config.get("memory_size")
+    if memory_size is not None and memory_size > max_memory:
+        raise ValueError(f"memory_size {memory_size} exceeds the limit of {max_memory} words")
+    outputs = request.get("outputs") or DEFAULT_OUTPUTS
+    unknown = set(outputs) - set(OUTPUTS)
+    if unknown:
+        raise ValueError(f"Unknown outputs: {', '.join(sorted(unknown))}")
+
+    program = request_program(request)
+    output = [] if "trace" in outputs else NullOutput()
+    pipeline = Pipeline(tracer=SILENT, output=output, program=program, **config)
+    if not advance(pipeline, program, until_cycle=limit):
+        raise ValueError(f"did not finish within {limit} cycles")
+    # 已經跑完，這裡只加上最終狀態與總 cycle 數
+    run_pipeline(pipeline, program)
+
+    result = {}
+    if "summary" in outputs:
+        result["summary"] = {
+            "instructions": len(program),
+            "cycles": pipeline.cycle,
+            "retired": pipeline.retired,
+            "cpi": pipeline.cycle / pipeline.retired if pipeline.retired else 0.0,
+            "stalls": pipeline.stall_cycles,
+            "flushes": pipeline.flush_count,
+        }
+    if "counters" in outputs:
+        result["counters"] = counters_report(pipeline)
+    if "registers" in outputs:
+        result["registers"] = list(pipeline.registers)
+    if "memory" in outputs:
+        result["memory"] = list(pipeline.memory)
+    if "trace" in outputs:
+        result["trace"] = output
+    return result
+
+
+def _warm_up():
+    """worker 啟動時先跑一次小程式，import 與第一次呼叫的成本不算在請求上"""
+    run_job({"source": ["add $1, $2, $3"]})
+
+
+class SimulationService:
+    """JSON-lines 模擬服務
+
+    每行一個請求：{"id": ..., "program": 路徑 或 "source": 指令, "config": {...}, "outputs": [...],
+    "max_cycles": N}，
+    完成一個就送回一行 {"id": ..., "result": {...}} 或 {"id": ..., "error": "..."}，順序依完成先後。
+    同時在處理中的請求最多 max_pending 個，滿了就暫停讀取，大批請求不會堆在記憶體中。
+    """
+
+    def __init__(self, workers=None, max_pending=None, max_cycles=MAX_CYCLES, max_memory=MAX_MEMORY_WORDS):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.max_cycles = max_cycles  # 每個請求最多模擬的 cycle 數，無窮迴圈不會一直佔住 worker
+        self.max_memory = max_memory  # 每個請求最多配置的記憶體字組數
+        self.executor = None
+
+    def start(self):
+        """啟動並暖機所有 worker
+
+        worker 由 forkserver 產生，不會繼承連線的 fd（否則服務端關閉連線時客戶端收不到 EOF），
+        worker 死掉後在服務中重建也一樣安全。
+        """
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver") if "forkserver" in methods else None
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_warm_up)
+        for future in [self.executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def close(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+    def restart(self, executor):
+        """executor 壞掉（worker 被砍掉）時換一組新的 worker，同一個 executor 只重建一次"""
+        if self.executor is executor:
+            self.close(wait=False)
+            self.start()
+
+    async def handle(self, line):
+        """處理一行請求，回傳回應的 dict
+
+        任何錯誤（包括 worker 中的 MemoryError、worker 行程死掉）都回傳 error，
+        每個請求剛好一行回應，也不會讓服務本身結束。
+        """
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except Exception as error:
+            return {"id": None, "error": f"Invalid request: {error}"}
+        response = {"id": request.get("id")}
+        executor = self.executor
+        try:
+            loop = asyncio.get_running_loop()
+            response["result"] = await loop.run_in_executor(executor, run_job, request,
+                                                            self.max_cycles, self.max_memory)
+        except BrokenProcessPool as error:
+            # 一個請求讓 worker 死掉時，之後的請求仍要能處理
+            self.restart(executor)
+            response["error"] = f"{type(error).__name__}: {error}"
+        except Exception as error:
+            response["error"] = f"{type(error).__name__}: {error}"
+        return response
+
+    async def serve(self, read_line, write_line):
+        """從 read_line 讀請求直到 EOF，回應以 write_line 寫出"""
+        slots = asyncio.Semaphore(self.max_pending)
+        tasks = set()
+
+        async def run(line):
+            try:
+                response = await self.handle(line)
+                await write_line(json.dumps(response) + "\n")
+            finally:
+                slots.release()
+
+        while True:
+            line = await read_line()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            await slots.acquire()
+            task = asyncio.ensure_future(run(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def serve_stdio(self):
+        loop = asyncio.get_running_loop()
+
+        async def read_line():
+            return await loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+        async def write_line(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        await self.serve(read_line, write_line)
+
+    async def serve_socket(self, path):
+        """在 Unix socket 上提供服務，每個連線各自是一串 JSON-lines"""
+        async def connection(reader, writer):
+            async def write_line(text):
+                writer.write(text.encode())
+                await writer.drain()
+
+            try:
+                await self.serve(reader.readline, write_line)
+            finally:
+                writer.close()
+
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(connection, path)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="常駐的模擬服務，以 JSON-lines 接收請求")
+    parser.add_argument("--socket", metavar="PATH", help="在 Unix socket 上服務，預設為標準輸入輸出")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker 行程數，預設為 CPU 核心數")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="同時處理中的請求上限，預設為 worker 數的 4 倍")
+    parser.add_argument("--max-cycles", type=int, default=MAX_CYCLES,
+                        help="每個請求最多模擬的 cycle 數，請求的 max_cycles 只能調低")
+    parser.add_argument("--max-memory", type=int, default=MAX_MEMORY_WORDS, metavar="WORDS",
+                        help="請求的 memory_size 上限（字組數）")
+    args = parser.parse_args(argv)
+
+    service = SimulationService(args.workers, args.max_pending, args.max_cycles, args.max_memory)
+    service.start()
+    try:
+        if args.socket:
+            asyncio.run(service.serve_socket(args.socket))
+        else:
+            asyncio.run(service.serve_stdio())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+from modules.analysis import format_histogram
+from modules.checkpoint import restore_pipeline, save_checkpoint
+from modules.counters import cpi_stack, format_cpi_stack, write_counters
+from modules.functional import run_functional
+from modules.pipeline import Pipeline
+from modules.program import as_program
+
+def next_cycle(pipeline, program):
+    """推進一個 cycle，往回跳的 beq taken 時（迴圈的開頭）回傳 True"""
+    instructions = program.instructions
+    index = pipeline.simulate_pipeline_index
+    if not pipeline.detect_hazard_lw_stall() and index < len(instructions):
+        current_instruction = instructions[index]
+        pipeline.simulate_pipeline_index = index + 1
+    elif index < len(instructions):
+        current_instruction = instructions[index]
+    else:
+        current_instruction = None
+
+    pipeline.step(current_instruction, index)
+    return pipeline.simulate_pipeline_index < index
+
+def advance(pipeline, program, until_cycle=None, until_retired=None):
+    """推進 pipeline，全部指令完成時回傳 True
+
+    到達 until_cycle 或 until_retired 時提早停下並回傳 False，之後可以再呼叫接續。
+    """
+    memo = pipeline.loop_memo if not pipeline.tracer.stage else None
+    end = len(program)
+
+    while (pipeline.IF_ID or pipeline.ID_EX or pipeline.EX_MEM or pipeline.MEM_WB
+           or pipeline.simulate_pipeline_index < end):
+        if until_cycle is not None and pipeline.cycle >= until_cycle:
+            return False
+        if until_retired is not None and pipeline.retired >= until_retired:
+            return False
+        if next_cycle(pipeline, program) and memo is not None:
+            memo.loop_head(pipeline, program, next_cycle, until_cycle, until_retired)
+    return True
+
+def run_pipeline(pipeline, program, checkpoint=None, checkpoint_every=0, memory_range=None,
+                 counters=None):
+    """以 Program 驅動 pipeline 直到所有指令完成
+
+    有給 checkpoint 路徑時，每 checkpoint_every 個 cycle 存一次 checkpoint。
+    memory_range 為 (start, stop)，指定最後要輸出的記憶體範圍。
+    counters 為路徑時，結束後將效能計數寫成 JSON。
+    """
+    if checkpoint and checkpoint_every:
+        while not advance(pipeline, program, pipeline.cycle + checkpoint_every):
+            output_offset = pipeline.output.tell() if hasattr(pipeline.output, "tell") else None
+            save_checkpoint(pipeline, checkpoint, output_offset)
+    else:
+        advance(pipeline, program)
+
+    append_final_state(pipeline, memory_range)
+
+    # 總執行周期數
+    pipeline.output.append(f"\nTotal Cycles: {pipeline.cycle}")
+    if pipeline.tracer.summary:
+        pipeline.tracer.write(f"Simulation finished: {pipeline.cycle} cycles, "
+                              f"{pipeline.stall_cycles} stalls, {pipeline.flush_count} flushes")
+        if pipeline.loop_memo and pipeline.loop_memo.skipped_iterations:
+            pipeline.tracer.write(f"Loop memo: skipped {pipeline.loop_memo.skipped_iterations} iterations "
+                                  f"({pipeline.loop_memo.skipped_cycles} cycles)")
+        pipeline.tracer.write(format_cpi_stack(cpi_stack(pipeline)))
+    if counters:
+        write_counters(pipeline, counters)
+    return pipeline.output
+
+def append_final_state(pipeline, memory_range=None):
+    """將最終寄存器和記憶體的狀態加到輸出，預設輸出前 32 個字組"""
+    start, stop = memory_range if memory_range else (0, 32)
+    stop = min(stop, len(pipeline.memory))
+    pipeline.output.append("\nFinal Register Values:")
+    pipeline.output.append(" ".join([f"${i}={pipeline.registers[i]}" for i in range(32)]))
+    pipeline.output.append("\nFinal Memory Values:")
+    pipeline.output.append(" ".join([f"M[{i}]={pipeline.memory[i]}" for i in range(start, stop)]))
+
+def simulate_pipeline(program, tracer=None, output=None, fast_forward=0,
+                      checkpoint=None, checkpoint_every=0, resume=None, memory=None, memory_range=None,
+                      loop_memo=True, counters=None, profiler=None, binary_trace=None, backend="interp"):
+    """模擬 Program（或 load_instructions 讀進來的各行），回傳輸出紀錄
+
+    fast_forward > 0 時前 fast_forward 條指令以功能模式執行，
+    之後才切換到逐 cycle 的管線模擬。
+    resume 為 load_checkpoint 讀到的內容時，從該狀態接續模擬。
+    memory 為 modules.memory 建立的記憶體，memory_range 指定最後輸出的範圍。
+    loop_memo 為 False 時不做迴圈記憶化，每一圈都逐 cycle 模擬。
+    counters 為路徑時，結束後將效能計數寫成 JSON。
+    profiler 為 StageProfiler 時量測各階段花的時間。
+    binary_trace 為 BinaryTraceWriter 時每個 cycle 記錄一列管線佔用情形。
+    backend 為 "threaded" 時 EX/MEM/WB 改用每條指令預先編譯好的函式。
+    """
+    # 程式只解碼一次，之後各階段只處理 Instruction
+    program = as_program(program)
+    pipeline = Pipeline(tracer=tracer, output=output, program=program, memory=memory,
+                        loop_memo=loop_memo, backend=backend)
+    if profiler is not None:
+        profiler.attach(pipeline)
+    if pipeline.tracer.summary:
+        pipeline.tracer.write(format_histogram(pipeline.analysis))
+    if resume is not None:
+        restore_pipeline(pipeline, resume)
+    elif fast_forward:
+        pc, count = run_functional(pipeline, program, 0, fast_forward)
+        pipeline.simulate_pipeline_index = pc
+        if pipeline.tracer.summary:
+            pipeline.tracer.write(f"Fast-forwarded {count} instructions, switching to pipeline at index {pc}")
+    if binary_trace is not None:
+        binary_trace.start_cycle = pipeline.outputcycle
+        pipeline.binary_trace = binary_trace
+    return run_pipeline(pipeline, program, checkpoint, checkpoint_every, memory_range, counters)
+
+def simulate_functional(program, tracer=None, output=None, max_instructions=None,
+                        memory=None, memory_range=None):
+    """只用功能模式執行程式，輸出最終狀態與執行的指令數"""
+    program = as_program(program)
+    pipeline = Pipeline(tracer=tracer, output=output, program=program, memory=memory)
+    pc, count = run_functional(pipeline, program, 0, max_instructions)
+    append_final_state(pipeline, memory_range)
+    pipeline.output.append(f"\nTotal Instructions: {count}")
+    if pipeline.tracer.summary:
+        pipeline.tracer.write(f"Functional run finished: {count} instructions")
+    return pipeline.output
@@ -0,0 +1,118 @@
+import argparse
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.io_handler import NullOutput
+from modules.memory import DEFAULT_MEMORY_WORDS
+from modules.pipeline import BRANCH_STAGES, LOAD_USE_POLICIES, Pipeline
+from modules.program import load_program
+from modules.simulator import advance
+from modules.trace import SILENT
+
+# 各選項的預設值，與 Pipeline 的建構參數同名
+DEFAULTS = {
+    "forwarding": True,
+    "branch_stage": "EX",
+    "load_use": "stall",
+    "memory_size": DEFAULT_MEMORY_WORDS,
+}
+
+# 單一變化超過這個 cycle 數就視為沒有結束
+MAX_CYCLES = 10_000_000
+
+# worker 行程中共用的 Program，由 initializer 設定一次
+_program = None
+
+
+def expand_grid(grid):
+    """{選項: [值, ...]} 展開成所有組合，沒給的選項用預設值"""
+    for name in grid:
+        if name not in DEFAULTS:
+            raise ValueError(f"Unknown sweep option: {name}")
+    names = list(DEFAULTS)
+    values = [list(grid.get(name) or [DEFAULTS[name]]) for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def run_variant(program, config, max_cycles=MAX_CYCLES):
+    """用一組設定模擬 program，回傳統計"""
+    result = dict(config)
+    try:
+        pipeline = Pipeline(tracer=SILENT, output=NullOutput(), program=program, **config)
+        finished = advance(pipeline, program, until_cycle=max_cycles)
+    except (ValueError, IndexError) as error:
+        result["error"] = f"{type(error).__name__}: {error}"
+        return result
+
+    result.update(cycles=pipeline.cycle, retired=pipeline.retired,
+                  cpi=pipeline.cycle / pipeline.retired if pipeline.retired else 0.0,
+                  stalls=pipeline.stall_cycles, flushes=pipeline.flush_count)
+    if not finished:
+        result["error"] = f"did not finish within {max_cycles} cycles"
+    return result
+
+
+def _init_worker(program):
+    global _program
+    _program = program
+
+
+def _run_config(args):
+    config, max_cycles = args
+    return run_variant(_program, config, max_cycles)
+
+
+def run_sweep(program, grid, jobs=None, max_cycles=MAX_CYCLES):
+    """平行模擬 grid 的所有組合，結果順序與 expand_grid 相同
+
+    Program 只在每個 worker 啟動時傳送一次，之後每個工作只傳設定。
+    """
+    configs = expand_grid(grid)
+    jobs = min(jobs or os.cpu_count() or 1, len(configs))
+    if jobs <= 1:
+        return [run_variant(program, config, max_cycles) for config in configs]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(program,)) as executor:
+        return list(executor.map(_run_config, [(config, max_cycles) for config in configs]))
+
+
+def format_sweep(results):
+    """將 sweep 結果排成比較表"""
+    lines = [f"{'forwarding':<10} {'branch':<6} {'load-use':<8} {'memory':>7} "
+             f"{'cycles':>10} {'CPI':>7} {'stalls':>8} {'flushes':>8}"]
+    for result in results:
+        prefix = (f"{'on' if result['forwarding'] else 'off':<10} {result['branch_stage']:<6} "
+                  f"{result['load_use']:<8} {result['memory_size']:>7} ")
+        if "cycles" in result:
+            lines.append(prefix + f"{result['cycles']:>10} {result['cpi']:>7.3f} "
+                                  f"{result['stalls']:>8} {result['flushes']:>8}")
+        if "error" in result:
+            lines.append(prefix + f"ERROR {result['error']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以多種管線設定模擬同一個程式並比較結果")
+    parser.add_argument("program", help="程式檔，例如 inputs/test3.txt")
+    parser.add_argument("--forwarding", nargs="+", choices=["on", "off"], default=["on"])
+    parser.add_argument("--branch-stage", nargs="+", choices=BRANCH_STAGES, default=["EX"])
+    parser.add_argument("--load-use", nargs="+", choices=LOAD_USE_POLICIES, default=["stall"])
+    parser.add_argument("--memory-size", nargs="+", type=int, default=[DEFAULT_MEMORY_WORDS])
+    parser.add_argument("--max-cycles", type=int, default=MAX_CYCLES)
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="平行的行程數，預設為 CPU 核心數")
+    args = parser.parse_args(argv)
+
+    grid = {
+        "forwarding": [value == "on" for value in args.forwarding],
+        "branch_stage": args.branch_stage,
+        "load_use": args.load_use,
+        "memory_size": args.memory_size,
+    }
+    results = run_sweep(load_program(args.program), grid, args.jobs, args.max_cycles)
+    print(format_sweep(results))
+    return 1 if any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import operator
+import weakref
+
+from modules.isa import OP_ADD, OP_BEQ, OP_LW, OP_SUB, OP_SW
+from modules.memory import to_word
+
+# Program -> 每條指令的 (execute, memory_access, write_back)，Program 被回收時一起丟掉
+_compiled = weakref.WeakKeyDictionary()
+
+
+def _compile_alu(k, instruction, forward, previous):
+    """add/sub 的 EX：暫存器編號與運算在編譯時固定"""
+    rs, rt = instruction.rs, instruction.rt
+    alu = operator.add if instruction.opcode == OP_ADD else operator.sub
+    forward_a, forward_b = forward
+    from_a, from_b = forward_a == "01", forward_b == "01"
+    # 靜態情況下 MEM/WB 是第 k-1 條，lw 轉送讀到的資料，其他轉送運算結果
+    from_data = previous is not None and previous.opcode == OP_LW
+    prev = k - 1
+
+    def execute(pipeline, latch):
+        mem_wb = pipeline.MEM_WB
+        registers = pipeline.registers
+        if (pipeline.analysis is not None and pipeline.EX_MEM is None
+                and (mem_wb.index if mem_wb is not None else -1) == prev):
+            pipeline.ForwardA = forward_a
+            pipeline.ForwardB = forward_b
+            if from_a:
+                pipeline.counters.forward_mem_wb_a += 1
+                a = mem_wb.data if from_data else mem_wb.result
+            else:
+                a = registers[rs]
+            if from_b:
+                pipeline.counters.forward_mem_wb_b += 1
+                b = mem_wb.data if from_data else mem_wb.result
+            else:
+                b = registers[rt]
+        elif not pipeline.forwarding:
+            pipeline.ForwardA = "00"
+            pipeline.ForwardB = "00"
+            a = registers[rs]
+            b = registers[rt]
+        else:
+            return pipeline.execute(latch)
+        pipeline.if_taken = 0
+        latch.result = alu(a, b)
+        return latch
+
+    return execute
+
+
+def _compile_beq(k, instruction, forward, previous, target):
+    """beq 的 EX：比較的暫存器與絕對目標在編譯時固定"""
+    rs, rt = instruction.rs, instruction.rt
+    forward_a, forward_b = forward
+    from_a, from_b = forward_a == "01", forward_b == "01"
+    from_data = previous is not None and previous.opcode == OP_LW
+    prev = k - 1
+
+    def execute(pipeline, latch):
+        if pipeline.branch_in_id:
+            return pipeline.execute(latch)
+        mem_wb = pipeline.MEM_WB
+        registers = pipeline.registers
+        counters = pipeline.counters
+        if (pipeline.analysis is not None and pipeline.EX_MEM is None
+                and (mem_wb.index if mem_wb is not None else -1) == prev):
+            pipeline.ForwardA = forward_a
+            pipeline.ForwardB = forward_b
+            if from_a:
+                counters.forward_mem_wb_a += 1
+                a = mem_wb.data if from_data else mem_wb.result
+            else:
+                a = registers[rs]
+            if from_b:
+                counters.forward_mem_wb_b += 1
+                b = mem_wb.data if from_data else mem_wb.result
+            else:
+                b = registers[rt]
+        elif not pipeline.forwarding:
+            pipeline.ForwardA = "00"
+            pipeline.ForwardB = "00"
+            a = registers[rs]
+            b = registers[rt]
+        else:
+            return pipeline.execute(latch)
+        pipeline.if_taken = 0
+        taken = latch.taken = a == b
+        if taken:
+            counters.taken_branches += 1
+            if pipeline.IF_ID:
+                counters.flushed_slots += 1
+            pipeline.IF_ID = None
+            pipeline.IF_ID_index = -1
+            pipeline.flush_count += 1
+            pipeline.redirect(target)
+        else:
+            counters.not_taken_branches += 1
+        return latch
+
+    return execute
+
+
+def _compile_address(k, instruction, forward):
+    """lw/sw 的 EX：base 與以字組為單位的 offset 在編譯時固定"""
+    base, words = instruction.base, instruction.offset // 4
+    forward_a, forward_b = forward
+    prev = k - 1
+
+    def execute(pipeline, latch):
+        mem_wb = pipeline.MEM_WB
+        if (pipeline.analysis is not None and pipeline.EX_MEM is None
+                and (mem_wb.index if mem_wb is not None else -1) == prev):
+            pipeline.ForwardA = forward_a
+            pipeline.ForwardB = forward_b
+        elif not pipeline.forwarding:
+            pipeline.ForwardA = "00"
+            pipeline.ForwardB = "00"
+        else:
+            pipeline.detect_forwarding_signals(latch)
+        pipeline.if_taken = 0
+        latch.address = pipeline.registers[base] + words
+        return latch
+
+    return execute
+
+
+def _compile_memory_access(instruction):
+    opcode = instruction.opcode
+    reg = instruction.reg
+    if opcode == OP_LW:
+        def memory_access(pipeline, latch):
+            latch.data = pipeline.memory[latch.address]
+            latch.rd = reg
+            return latch
+    elif opcode == OP_SW:
+        def memory_access(pipeline, latch):
+            pipeline.memory[latch.address] = to_word(pipeline.registers[reg])
+            return latch
+    else:
+        def memory_access(pipeline, latch):
+            return latch
+    return memory_access
+
+
+def _compile_write_back(instruction):
+    opcode = instruction.opcode
+    if opcode == OP_ADD or opcode == OP_SUB:
+        rd = instruction.rd
+
+        def write_back(pipeline, latch):
+            pipeline.retired += 1
+            pipeline.registers[rd] = latch.result
+    elif opcode == OP_LW:
+        rd = instruction.reg
+
+        def write_back(pipeline, latch):
+            pipeline.retired += 1
+            pipeline.registers[rd] = latch.data
+    else:
+        def write_back(pipeline, latch):
+            pipeline.retired += 1
+    return write_back
+
+
+# 不在程式中的指令（index 為 -1）與只會執行一次的指令，直接用 Pipeline 原本的方法
+INTERPRETED = (
+    lambda pipeline, latch: pipeline.execute(latch),
+    lambda pipeline, latch: pipeline.memory_access(latch),
+    lambda pipeline, latch: pipeline.write_back(latch),
+)
+
+
+def loop_indices(program):
+    """往回跳的 beq 與其目標之間（迴圈內）的指令 index"""
+    indices = set()
+    for k, target in enumerate(program.targets):
+        if target is not None and target <= k:
+            indices.update(range(target, k + 1))
+    return sorted(indices)
+
+
+def _compile(program, k):
+    instructions = program.instructions
+    instruction = instructions[k]
+    forward = program.analysis.forward[k]
+    previous = instructions[k - 1] if k > 0 else None
+    if instruction.opcode <= OP_SUB:
+        execute = _compile_alu(k, instruction, forward, previous)
+    elif instruction.opcode == OP_BEQ:
+        execute = _compile_beq(k, instruction, forward, previous, program.targets[k])
+    else:
+        execute = _compile_address(k, instruction, forward)
+    return execute, _compile_memory_access(instruction), _compile_write_back(instruction)
+
+
+def compile_stages(program, indices=None):
+    """每條指令的 (execute, memory_access, write_back)，同一個 Program 只編譯一次
+
+    預設只編譯迴圈內的指令，直線部分每條只執行一次，編譯反而比直譯慢；
+    indices 指定要編譯的指令時不快取（differential 檢查用來編譯全部指令）。
+    最後多放一組 INTERPRETED，index 為 -1 的 latch 剛好查到它。
+    轉送信號可以由靜態分析決定時直接用編譯時算好的結果，
+    其他情況（bubble 之後、branch 之後）交給 Pipeline 原本的方法。
+    """
+    if indices is None:
+        stages = _compiled.get(program)
+        if stages is None:
+            stages = _compiled[program] = compile_stages(program, loop_indices(program))
+        return stages
+    instructions = program.instructions
+    stages = [INTERPRETED] * (len(instructions) + 1)
+    for k in indices:
+        if instructions[k] is not None:
+            stages[k] = _compile(program, k)
+    return tuple(stages)
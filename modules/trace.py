@@ -0,0 +1,51 @@
+TRACE_SILENT = 0   # 不輸出任何追蹤訊息
+TRACE_SUMMARY = 1  # 只輸出模擬結束時的摘要
+TRACE_CYCLE = 2    # 每個 cycle 輸出該 cycle 的管線紀錄
+TRACE_STAGE = 3    # 每個階段的除錯訊息與管線狀態
+
+TRACE_LEVELS = {
+    "silent": TRACE_SILENT,
+    "summary": TRACE_SUMMARY,
+    "cycle": TRACE_CYCLE,
+    "stage": TRACE_STAGE,
+}
+
+
+def parse_trace_level(value):
+    """將名稱或數字轉成追蹤等級"""
+    if isinstance(value, int):
+        level = value
+    elif value.isdigit():
+        level = int(value)
+    elif value.lower() in TRACE_LEVELS:
+        return TRACE_LEVELS[value.lower()]
+    else:
+        raise ValueError(f"Unknown trace level: {value}")
+    if not TRACE_SILENT <= level <= TRACE_STAGE:
+        raise ValueError(f"Unknown trace level: {value}")
+    return level
+
+
+class Tracer:
+    """模擬過程的追蹤輸出，write 可替換成任何接受字串的函式
+
+    呼叫端先檢查 summary/cycle/stage 旗標再組字串，
+    關閉的等級不會做任何格式化。
+    """
+
+    def __init__(self, level=TRACE_STAGE, write=print):
+        self.level = parse_trace_level(level)
+        self.write = write
+        self.summary = self.level >= TRACE_SUMMARY
+        self.cycle = self.level >= TRACE_CYCLE
+        self.stage = self.level >= TRACE_STAGE
+
+    def cycle_lines(self, cycle, lines):
+        """輸出單一 cycle 的管線紀錄"""
+        self.write(f"Cycle {cycle}")
+        for line in lines:
+            self.write(f" {line}")
+        self.write("")
+
+
+SILENT = Tracer(TRACE_SILENT)
@@ -0,0 +1,123 @@
+import argparse
+import os
+import random
+
+# $31 固定保持初始值 1，當作常數使用
+ONE = 31
+
+
+def load_constant(register, value):
+    """以加法組出常數：先清成 0，再依二進位位元倍增並加 1"""
+    lines = [f"sub ${register}, ${register}, ${register}"]
+    for bit in bin(value)[2:]:
+        lines.append(f"add ${register}, ${register}, ${register}")
+        if bit == "1":
+            lines.append(f"add ${register}, ${register}, ${ONE}")
+    return lines
+
+
+def alu_chain(length):
+    """彼此相依的 add/sub 長鏈，每條都用到前一條的結果"""
+    lines = []
+    for i in range(length):
+        op = "add" if i % 2 == 0 else "sub"
+        lines.append(f"{op} $1, $1, ${2 + i % 4}")
+    return lines
+
+
+def load_use_chain(length):
+    """lw 後緊接著使用載入值的指令，每組都會產生 load-use stall"""
+    lines = []
+    for i in range(length // 3):
+        slot = 4 * (i % 8)
+        lines.append(f"lw $1, {slot}($0)")
+        lines.append("add $2, $1, $1")
+        lines.append(f"sw $2, {slot + 32}($0)")
+    return lines
+
+
+def beq_loop(iterations, body=None):
+    """以 beq 構成的迴圈，執行 iterations 次 body
+
+    迴圈尾端先用 beq 檢查計數器是否為 0 跳出，否則以 beq $0, $0 往回跳，
+    與 inputs/test4.txt 一樣使用負的 offset。迴圈後保留兩條指令，
+    確保往回跳時後面還有指令可以抓。
+    """
+    if iterations < 1:
+        raise ValueError("iterations must be at least 1")
+    if body is None:
+        body = ["add $1, $1, $31", "lw $2, 4($0)", "add $3, $2, $1", "sw $3, 8($0)"]
+    lines = load_constant(5, iterations)
+    head = len(lines)
+    lines.extend(body)
+    lines.append(f"sub $5, $5, ${ONE}")
+    lines.append("beq $5, $0, 1")
+    lines.append(f"beq $0, $0, {head - len(lines) - 1}")
+    lines.append("sw $1, 0($0)")
+    lines.append("sw $5, 4($0)")
+    return lines
+
+
+def random_mix(length, seed=0, branch_rate=0.05):
+    """隨機混合 add/sub/lw/sw 與向前跳的 beq
+
+    $1-$4 只由 lw 或加減常數寫入，$6-$9 由兩個 $1-$4 相加減寫入，
+    暫存器的值不會無限制成長。
+    """
+    rng = random.Random(seed)
+    small = [1, 2, 3, 4]
+    large = [6, 7, 8, 9]
+    lines = []
+    for i in range(length):
+        r = rng.random()
+        if r < branch_rate and i + 4 < length:
+            a, b = rng.choice(small + large), rng.choice(small + large)
+            lines.append(f"beq ${a}, ${b}, {rng.randint(1, 2)}")
+        elif r < 0.30:
+            register = rng.choice(small)
+            op = rng.choice(("add", "sub"))
+            lines.append(f"{op} ${register}, ${rng.choice(small)}, ${ONE}")
+        elif r < 0.55:
+            op = rng.choice(("add", "sub"))
+            lines.append(f"{op} ${rng.choice(large)}, ${rng.choice(small)}, ${rng.choice(small)}")
+        elif r < 0.80:
+            lines.append(f"lw ${rng.choice(small)}, {4 * rng.randint(0, 31)}($0)")
+        else:
+            lines.append(f"sw ${rng.choice(small + large)}, {4 * rng.randint(0, 31)}($0)")
+    return lines
+
+
+GENERATORS = {
+    "alu-chain": lambda size, seed: alu_chain(size),
+    "load-use": lambda size, seed: load_use_chain(size),
+    "beq-loop": lambda size, seed: beq_loop(max(1, size // 7)),
+    "random": lambda size, seed: random_mix(size, seed),
+}
+
+
+def write_program(lines, file_path):
+    """將產生的程式寫成 load_instructions 可讀的檔案"""
+    directory = os.path.dirname(file_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(file_path, 'w') as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="產生合成測試程式")
+    parser.add_argument("kind", choices=sorted(GENERATORS))
+    parser.add_argument("--size", type=int, default=1000, help="大約的動態指令數")
+    parser.add_argument("--count", type=int, default=1, help="產生幾個程式（random 以不同 seed 產生）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output-dir", default="inputs/generated")
+    args = parser.parse_args(argv)
+
+    for i in range(args.count):
+        lines = GENERATORS[args.kind](args.size, args.seed + i)
+        write_program(lines, os.path.join(args.output_dir, f"{args.kind}-{args.size}-{args.seed + i}.txt"))
+    print(f"Wrote {args.count} program(s) to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()